@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Data Structures and Algorithms for CL 3, Project 1
+See <https://https://dsacl3-2022.github.io/p1/> for detailed instructions.
+Author:      Pun Ching Nei, Lorena Raichle, Kateryna Smykovska
+Honor Code:  I pledge that this program represents my work.
+We received help from: no one in designing and debugging our program.
+"""
+
+import argparse
+import json
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+from fsa import build_trie
+from fst import FST, FrozenFST
+from spellcheck import DeleteIndex, build_editfst
+
+
+def scaled_lexicon(words, size, seed=0):
+    """Return `words` extended with generated words to `size` words.
+
+    The new words are sampled from a letter bigram model of `words`,
+    so they look like the real ones (length, common prefixes and
+    suffixes). The result is deterministic for a given seed.
+    """
+    lexicon = set(words)
+    if len(lexicon) >= size:
+        return sorted(lexicon)
+    rng = random.Random(seed)
+    following = {}  # letter -> letters seen after it ('' marks the end)
+    for word in words:
+        for a, b in zip(" " + word, word):
+            following.setdefault(a, []).append(b)
+        following.setdefault(word[-1] if word else " ", []).append("")
+    while len(lexicon) < size:
+        word, char = "", " "
+        while True:
+            char = rng.choice(following[char])
+            if not char or len(word) > 20:
+                break
+            word += char
+        if word:
+            lexicon.add(word)
+    return sorted(lexicon)
+
+
+def percentiles(times):
+    p50, p95, p99 = np.percentile(np.array(times) * 1000, [50, 95, 99])
+    return {"p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "mean_ms": np.mean(times) * 1000}
+
+
+def timed(stages, name, f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    stages[name] = time.perf_counter() - start
+    return result
+
+
+def run(words, counts, pairs, engine="frozen", nbest=5):
+    """Run the spell checking pipeline once and return its measurements.
+
+    `pairs` are (misspelling, correct word) pairs used as queries.
+    Each query is also answered by a DeleteIndex with one edit, and
+    "delete_index_agreement" is the share of queries where it found
+    the same n best words as the FST. With engine "frozen" the
+    composition is built with FrozenFST.compose(), with "dict" with
+    FST.compose_fst().
+    """
+    stages = {}
+    fsa = timed(stages, "build_trie", build_trie, words)  # already minimal
+    lexicon = timed(stages, "fromfsa", FST.fromfsa, fsa)
+    letters = set(char for word in words for char in word)
+    edits = timed(stages, "build_editfst", build_editfst, letters, counts)
+    if engine == "frozen":
+        spellfst = timed(stages, "compose_fst", FrozenFST.compose, lexicon, edits)
+        spellfst = timed(stages, "invert", spellfst.invert)
+        states, arcs = spellfst.num_states, spellfst.num_arcs
+    else:
+        spellfst = timed(stages, "compose_fst", FST.compose_fst, lexicon, edits)
+        timed(stages, "invert", spellfst.invert)
+        states = len(spellfst._states)
+        arcs = sum(len(targets) for targets in spellfst.transitions.values())
+    index = timed(stages, "delete_index", DeleteIndex, words, counts, 1)
+
+    latency = {"transduce": [], "transduce_nbest": [], "delete_index": []}
+    top1 = top5 = agree = 0
+    for misspelling, correct in pairs:
+        start = time.perf_counter()
+        spellfst.transduce(misspelling)
+        latency["transduce"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        best = [word for word, _ in spellfst.transduce_nbest(misspelling, nbest)]
+        latency["transduce_nbest"].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        candidates = [word for word, _ in index.correct(misspelling, 1, nbest)]
+        latency["delete_index"].append(time.perf_counter() - start)
+        agree += set(candidates) == set(best)
+        top1 += best[:1] == [correct]
+        top5 += correct in best[:5]
+    known = sum(fsa.recognize(correct) for _, correct in pairs)
+    return {
+        "engine": engine,
+        "lexicon_size": len(words),
+        "stages_s": stages,
+        "lexicon_states": len(fsa._states),
+        "lexicon_arcs": len(fsa.transitions),
+        "spellfst_states": states,
+        "spellfst_arcs": arcs,
+        "latency": {name: percentiles(times) for name, times in latency.items()},
+        "accuracy": {"queries": len(pairs), "correct_in_lexicon": known,
+                     "top1": top1 / len(pairs), "top5": top5 / len(pairs),
+                     "delete_index_agreement": agree / len(pairs)},
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the spell checker.")
+    parser.add_argument("--lexicon", default="lexicon.txt")
+    parser.add_argument("--errors", default="spell-errors.json")
+    parser.add_argument("--pairs", default="spelling-data.txt",
+                        help="misspelling - correct word pairs, tab separated")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[10000, 100000, 1000000],
+                        help="sizes of the generated lexicons")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--engine", choices=("frozen", "dict"), default="frozen")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file for the results (default: stdout)")
+    args = parser.parse_args(argv)
+
+    with open(args.lexicon, 'rt') as f:
+        words = f.read().strip().split()
+    with open(args.errors, 'rt') as f:
+        counts = json.loads(f.read())
+    with open(args.pairs, 'rt') as f:
+        pairs = [tuple(line.strip().split('\t')) for line in f]
+    pairs = random.Random(args.seed).sample(pairs, min(args.queries, len(pairs)))
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    results = {"commit": commit, "python": platform.python_version(),
+               "platform": platform.platform(), "queries": len(pairs), "runs": []}
+    lexicons = [("lexicon.txt", sorted(set(words)))]
+    lexicons += [("scaled-{}".format(size), scaled_lexicon(words, size, args.seed))
+                 for size in args.sizes]
+    for name, lexicon in lexicons:
+        # a fresh process for each run, so that peak RSS is its own
+        with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+            result = pool.submit(run, lexicon, counts, pairs, args.engine).result()
+        result["lexicon"] = name
+        results["runs"].append(result)
+        print("{}: {} words, {:.2f} s".format(name, len(lexicon), sum(result["stages_s"].values())),
+              file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, 'wt') as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
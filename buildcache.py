@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Data Structures and Algorithms for CL 3, Project 1
+See <https://https://dsacl3-2022.github.io/p1/> for detailed instructions.
+Author:      Pun Ching Nei, Lorena Raichle, Kateryna Smykovska
+Honor Code:  I pledge that this program represents my work.
+We received help from: no one in designing and debugging our program.
+"""
+
+import hashlib
+import inspect
+import json
+import linecache
+import os
+import pickle
+import tempfile
+import time
+
+from fst import FILE_VERSION, FrozenFST
+
+CACHE_VERSION = 1  # changed when the way we store artifacts changes
+
+
+def digest(value):
+    """ Return a hex digest of the content of value.
+
+    Artifacts are represented by their key, JSON-serializable values
+    by their canonical JSON form, and anything else by its pickle.
+    """
+    if isinstance(value, Artifact):
+        return value.key
+    try:
+        data = json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    except TypeError:
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    return hashlib.sha256(data).hexdigest()
+
+
+def _owner(obj):
+    """ Return the class defining a method, or obj itself.
+    """
+    path = obj.__qualname__.split(".")
+    if len(path) == 1 or "<locals>" in path:
+        return obj
+    owner = inspect.getmodule(obj)
+    for name in path[:-1]:
+        owner = getattr(owner, name)
+    return owner
+
+
+def _last_line(code):
+    """ Return the last source line of a code object and the code nested in it.
+    """
+    lines = [line for _, _, line in code.co_lines() if line is not None]
+    lines += [_last_line(const) for const in code.co_consts if inspect.iscode(const)]
+    return max(lines, default=code.co_firstlineno)
+
+
+def _names(code):
+    """ Return the global and attribute names used by a code object
+    and the code nested in it.
+    """
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _names(const)
+    return names
+
+
+def _local(value, directory):
+    """ Whether value is a function or class defined in a module of directory.
+    """
+    if not (inspect.isfunction(value) or inspect.isclass(value)):
+        return False
+    try:
+        return os.path.dirname(os.path.abspath(inspect.getfile(value))) == directory
+    except TypeError:  # built-in
+        return False
+
+
+def _value_digest(value):
+    try:
+        return digest(value)
+    except Exception:  # neither JSON nor picklable: only its type counts
+        return type(value).__qualname__
+
+
+def _dependencies(obj):
+    """ Yield the pieces of code and data that obj depends on.
+
+    These are the source of obj (of each method if it is a class),
+    the argument defaults and class attributes, and the module-level
+    values its code reads. Functions and classes it uses are followed
+    if they are defined next to it (in a module of the same
+    directory), so helpers need not be listed by the caller. The
+    source is taken from the line numbers of the code objects:
+    inspect.getsource() tokenizes (or, for a class, parses the whole
+    module), which takes longer than loading a cached artifact.
+    """
+    todo = [obj]
+    seen = set()
+    while todo:
+        obj = todo.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if inspect.isclass(obj):
+            for name, member in vars(obj).items():
+                if isinstance(member, property):
+                    member = member.fget
+                member = getattr(member, "__func__", member)  # class and static methods
+                if inspect.isfunction(member):
+                    todo.append(member)
+                elif not name.startswith("__") and not callable(member):
+                    yield "{}.{} = {}".format(obj.__qualname__, name, _value_digest(member))
+            continue
+        code = obj.__code__
+        lines = linecache.getlines(code.co_filename)
+        yield "".join(lines[code.co_firstlineno - 1:_last_line(code)])
+        defaults = list(obj.__defaults__ or ()) + sorted((obj.__kwdefaults__ or {}).items())
+        if defaults:
+            yield "{} defaults = {}".format(obj.__qualname__, _value_digest(defaults))
+        directory = os.path.dirname(os.path.abspath(code.co_filename))
+        for name in sorted(_names(code)):
+            if name not in obj.__globals__:
+                continue
+            value = obj.__globals__[name]
+            if _local(value, directory):
+                todo.append(_owner(value))
+            elif not (callable(value) or inspect.ismodule(value)):
+                yield "{} = {}".format(name, _value_digest(value))
+
+
+def code_version(objects):
+    """ Return a digest of the code of objects (functions and classes)
+    and of everything they depend on (see _dependencies()).
+
+    A method stands for its whole class, as it may call any other
+    method. Only the source and the values count, not where they are
+    defined, so the digest is the same whether a module runs as a
+    script or is imported.
+    """
+    pieces = sorted({piece for obj in objects for piece in _dependencies(_owner(obj))})
+    h = hashlib.sha256()
+    for piece in pieces:
+        h.update(piece.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class Artifact:
+    """The output of a build stage, computed or loaded on demand.
+
+    The key is a hash of the stage name, the version of its code and
+    the keys (or contents) of its inputs, so it is known before
+    anything is computed. value() loads the artifact from the cache
+    if it is there, otherwise it computes it from the values of the
+    inputs (which are loaded or computed in turn) and stores it.
+    """
+
+    def __init__(self, cache, stage, compute, inputs, key=None):
+        self.cache = cache
+        self.stage = stage
+        self.compute = compute
+        self.inputs = inputs
+        self.key = key
+        self._value = None
+
+    def value(self):
+        if self._value is None:
+            self._value = self.cache.load(self)
+        if self._value is None:
+            args = [arg.value() if isinstance(arg, Artifact) else arg
+                    for arg in self.inputs]
+            self._value = self.compute(*args)
+            self.cache.store(self, self._value)
+        return self._value
+
+
+class BuildCache:
+    """A content-addressed cache of the outputs of build stages.
+
+    Each artifact is stored in 'directory' under its key: FrozenFSTs
+    in the binary format of FrozenFST.save() (and memory-mapped when
+    loaded), everything else pickled. Since the key covers the inputs
+    and the code, a changed input or function simply gives a new key,
+    and only the stages depending on it are built again. If
+    'directory' is None nothing is stored, and every stage is computed.
+
+    Old artifacts are never read again, so after each store the cache
+    is pruned: artifacts not used for 'max_age' seconds are removed,
+    and then the least recently used ones until the cache takes at
+    most 'max_bytes' (either limit can be None).
+
+    Attributes:
+        hits, misses: number of artifacts loaded and computed
+        removed: number of artifacts pruned
+    """
+
+    def __init__(self, directory=None, max_bytes=2**30, max_age=30 * 24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.removed = 0
+        self._versions = dict()  # code objects -> code_version()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def stage(self, name, compute, *inputs, code=None):
+        """ Return an Artifact for compute(*inputs).
+
+        'inputs' are Artifacts of earlier stages or plain values.
+        'code' are the functions and classes the result depends on,
+        by default just compute. What they use is followed (see
+        code_version()), so only a lambda needs to name the
+        functions it calls.
+        """
+        if self.directory is None:
+            # nothing is looked up, so there is no need for a key
+            return Artifact(self, name, compute, inputs)
+        code = tuple(code) if code is not None else (compute,)
+        if code not in self._versions:
+            self._versions[code] = code_version(code)
+        key = digest([CACHE_VERSION, FILE_VERSION, name, self._versions[code],
+                      [digest(arg) for arg in inputs]])
+        return Artifact(self, name, compute, inputs, key)
+
+    def _path(self, artifact, extension):
+        return os.path.join(self.directory, "{}-{}.{}".format(artifact.stage, artifact.key,
+                                                             extension))
+
+    def load(self, artifact):
+        """ Return the stored value of artifact, or None.
+        """
+        if self.directory is None:
+            return None
+        for extension in ("fst", "pickle"):
+            path = self._path(artifact, extension)
+            try:
+                # the access time is unreliable (noatime), so the
+                # modification time records when it was last used
+                os.utime(path)
+            except FileNotFoundError:
+                continue
+            self.hits += 1
+            if extension == "fst":
+                return FrozenFST.load(path)
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        return None
+
+    def store(self, artifact, value):
+        """ Write the value of artifact to the cache.
+
+        The file is written under a temporary name and renamed, so
+        concurrent builds never see a partial artifact.
+        """
+        self.misses += 1
+        if self.directory is None:
+            return
+        extension = "fst" if isinstance(value, FrozenFST) else "pickle"
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if extension == "pickle":
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            if extension == "fst":
+                value.save(tmp)
+            os.replace(tmp, self._path(artifact, extension))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.prune(keep=self._path(artifact, extension))
+
+    def prune(self, keep=None):
+        """ Remove the artifacts over the age and size limits, except
+        the file 'keep'. Returns the number of artifacts removed.
+        """
+        if self.directory is None:
+            return 0
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith((".fst", ".pickle")) and entry.path != keep:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:  # removed by another build
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()  # least recently used first
+        total = sum(size for _, size, _ in entries)
+        if keep is not None and os.path.exists(keep):
+            total += os.path.getsize(keep)
+        now = time.time()
+        removed = 0
+        for mtime, size, path in entries:
+            old = self.max_age is not None and now - mtime > self.max_age
+            big = self.max_bytes is not None and total > self.max_bytes
+            if not (old or big):
+                break
+            try:
+                # a loaded FrozenFST keeps its memory map of the file
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        self.removed += removed
+        return removed
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "removed": self.removed}
@@ -9,6 +9,10 @@ We received help from: no one in designing and debugging our program.
 
 import numpy as np
 import json
+import multiprocessing
+import os
+
+from editmodel import EditModel
 
 
 def cost(ch1, ch2, counts=None):
@@ -24,7 +28,11 @@ def cost(ch1, ch2, counts=None):
     counts, and return `1 - p` as the cost (you should also consider
     using a smoothing technique). You are also welcome to
     experiment with other scoring functions.
+    `counts` can also be an EditModel compiled from the counts, which
+    makes the lookup constant time.
     """
+    if isinstance(counts, EditModel):
+        return counts.edit_cost(ch1, ch2)
     if counts is None:
         if ch1 == ch2:
             return 0
@@ -67,52 +75,173 @@ def find_edits(s1, s2, counts=None):
     s2      The target sequences.
     counts  A dictionary of dictionaries with counts of edit
             operations (see assignment description for more
-            information and an example)
+            information and an example), or an EditModel
+    """
+    return align_batch([(s1, s2)], counts)[0]
+
+
+# back-pointers of the alignment table, in the order we prefer them
+# when two operations give the same cost
+INSERT, DELETE, SUBSTITUTE = 0, 1, 2
+
+
+def _cost_table(pairs, counts):
+    """ Return (ids, costs): a symbol -> index mapping with '' as 0 and
+    a matrix of costs for each pair of indices.
+    """
+    if counts is None:
+        symbols = sorted(set(ch for s1, s2 in pairs for ch in s1 + s2))
+        ids = {sym: i for i, sym in enumerate([''] + symbols)}
+        costs = 1 - np.eye(len(ids))
+        return ids, costs
+    if not isinstance(counts, EditModel):
+        counts = EditModel(counts)
+    # symbols that are not in the model all get the 'unknown' index
+    ids = dict(counts.ids)
+    for s1, s2 in pairs:
+        for ch in s1 + s2:
+            if ch not in ids:
+                ids[ch] = counts.unknown
+    return ids, counts.cost
+
+
+def _align_padded(s1, s2, len1, len2, costs, second=False):
+    """ Fill the edit distance tables of a batch of padded pairs.
+
+    s1 and s2 are (batch, length) arrays of symbol indices. The table
+    is filled one anti-diagonal (i + j = k) at a time: the cells of a
+    diagonal only depend on the two previous diagonals, so each one is
+    computed for the whole batch with a few array operations. Returns
+    the back-pointer table (batch, len1 + 1, len2 + 1). With `second`,
+    returns (back, d, d2), where d is the table of best costs and d2
+    the table of costs of the second best alignments.
     """
-    lens1, lens2 = len(s1), len(s2)
-    d = np.zeros((lens1 + 1, lens2 + 1))
-    edits = []
-
-    # finds a MED between s1 and s2
-    # iterates over the indices of s1 from 1 to lens1, and the inner loop - over s2 from 1 to lens2
-    for i in range(1, lens1 + 1):
-        # initializes the first column of d with the cost of transforming the empty string to the prefix of s1 from 1 to i
-        d[i, 0] = d[i - 1, 0] + cost(s1[i - 1], '', counts)
-
-    # initializes the first row of d with the cost of transforming the empty string to the prefix of s2 from 1 to j
-    for j in range(1, lens2 + 1):
-        d[0, j] = d[0, j - 1] + cost('', s2[j - 1], counts)
-
-    # fills in the remaining entries of d using the recursive formula for the minimum edit distance
-    for i in range(1, lens1 + 1):
-        for j in range(1, lens2 + 1):
-            # the cost of transforming the prefix of s1 up to i-1 to the prefix of s2 up to j (by deleting s1[i-1])
-            d[i, j] = min(d[i - 1, j] + cost(s1[i - 1], '', counts),
-                          # the cost of transforming the prefix of s1 up to i to the prefix of s2 up to j-1 (by inserting s2[j-1])
-                          d[i, j - 1] + cost('', s2[j - 1], counts),
-                          # the cost of transforming the prefix of s1 up to i-1 to the prefix of s2 up to j-1 (by replacing s1[i-1] with s2[j-1])
-                          d[i - 1, j - 1] + cost(s1[i - 1], s2[j - 1], counts))
-
-    # BACKTRACKING
-    x, y = lens1, lens2
-    while x > 0 and y > 0:
-        c1, c2 = s1[x - 1], s2[y - 1]
-        # substitution
-        if y > 0 and d[x, y] == d[x, y - 1] + cost('', s2[y - 1], counts):
-            edits.insert(0, ('', s2[y - 1]))
-            y -= 1
-        # deletion
-        elif x > 0 and d[x, y] == d[x - 1, y] + cost(s1[x - 1], '', counts):
-            edits.insert(0, (s1[lens1 - 1], ''))
-            x -= 1
-        # insertion
-        elif x > 0 and y > 0 and d[x, y] == d[x - 1, y - 1] + cost(s1[x - 1], s2[y - 1], counts):
-            edits.insert(0, (s1[x - 1], s2[y - 1]))
-            x -= 1
-            y -= 1
+    batch = s1.shape[0]
+    rows = np.arange(batch)[:, None]
+    d = np.full((batch, len1 + 1, len2 + 1), np.inf)
+    back = np.zeros((batch, len1 + 1, len2 + 1), dtype=np.int8)
+    d[:, 0, 0] = 0
+    if second:
+        d2 = np.full((batch, len1 + 1, len2 + 1), np.inf)
+    for k in range(1, len1 + len2 + 1):
+        i = np.arange(max(0, k - len2), min(k, len1) + 1)
+        j = k - i
+        candidates = np.full((3, batch, len(i)), np.inf)
+        if second:
+            seconds = np.full((3, batch, len(i)), np.inf)
+        has_j = j > 0
+        has_i = i > 0
+        if has_j.any():
+            ii, jj = i[has_j], j[has_j]
+            cost = costs[0, s2[:, jj - 1]]
+            candidates[INSERT][:, has_j] = d[:, ii, jj - 1] + cost
+            if second:
+                seconds[INSERT][:, has_j] = d2[:, ii, jj - 1] + cost
+        if has_i.any():
+            ii, jj = i[has_i], j[has_i]
+            cost = costs[s1[:, ii - 1], 0]
+            candidates[DELETE][:, has_i] = d[:, ii - 1, jj] + cost
+            if second:
+                seconds[DELETE][:, has_i] = d2[:, ii - 1, jj] + cost
+        both = has_i & has_j
+        if both.any():
+            ii, jj = i[both], j[both]
+            cost = costs[s1[rows, ii - 1], s2[rows, jj - 1]]
+            candidates[SUBSTITUTE][:, both] = d[:, ii - 1, jj - 1] + cost
+            if second:
+                seconds[SUBSTITUTE][:, both] = d2[:, ii - 1, jj - 1] + cost
+        best = candidates.argmin(axis=0)
+        d[:, i, j] = np.take_along_axis(candidates, best[None], axis=0)[0]
+        back[:, i, j] = best
+        if second:
+            # the second best path either takes the same last step as
+            # the best one after the second best path to its cell, or
+            # another last step after the best path to that cell
+            via_best = np.take_along_axis(seconds, best[None], axis=0)[0]
+            np.put_along_axis(candidates, best[None], np.inf, axis=0)
+            d2[:, i, j] = np.minimum(via_best, candidates.min(axis=0))
+    if second:
+        return back, d, d2
+    return back
+
+
+def align_batch(pairs, counts=None, batch_size=1024, margins=False):
+    """ Run find_edits() on a sequence of (s1, s2) pairs.
+
+    The pairs are sorted by length and aligned in batches of at most
+    `batch_size` padded pairs, the table of each batch being filled
+    by anti-diagonals (see _align_padded()). We keep a back-pointer
+    for each cell, so backtracking does not compute costs again.
+    Returns the list of edits of each pair, in the order of `pairs`.
+    With `margins`, returns (edits, margins) where margins[p] is the
+    cost of the second best alignment of pair p minus the cost of
+    the best one (inf if there is only one alignment).
+    """
+    pairs = list(pairs)
+    ids, costs = _cost_table(pairs, counts)
+    order = sorted(range(len(pairs)), key=lambda p: (len(pairs[p][0]), len(pairs[p][1])))
+    results = [None] * len(pairs)
+    gaps = [None] * len(pairs)
+    for start in range(0, len(order), batch_size):
+        chunk = order[start:start + batch_size]
+        len1 = max(len(pairs[p][0]) for p in chunk)
+        len2 = max(len(pairs[p][1]) for p in chunk)
+        # the padding (index 0) is never read for the real cells
+        s1 = np.zeros((len(chunk), max(len1, 1)), dtype=np.intp)
+        s2 = np.zeros((len(chunk), max(len2, 1)), dtype=np.intp)
+        for b, p in enumerate(chunk):
+            s1[b, :len(pairs[p][0])] = [ids[ch] for ch in pairs[p][0]]
+            s2[b, :len(pairs[p][1])] = [ids[ch] for ch in pairs[p][1]]
+        if margins:
+            back, d, d2 = _align_padded(s1, s2, len1, len2, costs, second=True)
         else:
-            break
-    return edits
+            back = _align_padded(s1, s2, len1, len2, costs)
+
+        # BACKTRACKING
+        for b, p in enumerate(chunk):
+            w1, w2 = pairs[p]
+            x, y = len(w1), len(w2)
+            if margins:
+                gaps[p] = float(d2[b, x, y] - d[b, x, y])
+            pointers = back[b]
+            edits = []
+            while x > 0 or y > 0:
+                op = pointers[x, y]
+                if op == INSERT:
+                    edits.append(('', w2[y - 1]))
+                    y -= 1
+                elif op == DELETE:
+                    edits.append((w1[x - 1], ''))
+                    x -= 1
+                else:
+                    edits.append((w1[x - 1], w2[y - 1]))
+                    x -= 1
+                    y -= 1
+            edits.reverse()
+            results[p] = edits
+    if margins:
+        return results, gaps
+    return results
+
+
+def read_pairs(filename):
+    """ Return the list of (word, misspelling) pairs in filename.
+    """
+    with open(filename, 'r') as fin:
+        return [tuple(line.strip().split('\t')) for line in fin]
+
+
+def add_edits(counts, alignments):
+    """ Add the aligned pairs of letters of each alignment to counts.
+    """
+    for edits in alignments:
+        for ch1, ch2 in edits:
+            if ch1 not in counts:
+                counts[ch1] = {}
+            if ch2 not in counts[ch1]:
+                counts[ch1][ch2] = 0
+            counts[ch1][ch2] += 1
+    return counts
 
 
 def count_edits(filename, counts=None):
@@ -125,26 +254,235 @@ def count_edits(filename, counts=None):
     """
     if counts is None:
         counts = {'': {'': 0}}
+    return add_edits(counts, align_batch(read_pairs(filename)))
 
-    with open(filename, 'r') as fin:
-        for line in fin:
-            word, misspelling = line.strip().split('\t')
-            for ch1, ch2 in find_edits(word, misspelling):
-                if ch1 not in counts:
-                    counts[ch1] = {}
-                if ch2 not in counts[ch1]:
-                    counts[ch1][ch2] = 0
-                counts[ch1][ch2] += 1
+
+def add_delta(counts, delta):
+    """ Add a dictionary {(ch1, ch2): change} to counts.
+    """
+    for (ch1, ch2), n in delta.items():
+        row = counts.setdefault(ch1, {})
+        row[ch2] = row.get(ch2, 0) + n
+        # an edit seen zero times would get probability 0
+        if row[ch2] == 0 and (ch1 or ch2):
+            del row[ch2]
+            if not row:
+                del counts[ch1]
+    return counts
+
+
+class EditCounter:
+    """ Alignments of training pairs and the edit counts they give.
+
+    The pairs are aligned once, and we keep the alignment of each pair,
+    the margin between its cost and the cost of the second best
+    alignment, and the counts summed over all pairs. When the costs
+    change, the alignment of a pair can only change if the costs
+    along it grow, or the costs along another alignment shrink, by
+    more than its margin. update() only realigns the pairs where this
+    may happen, and only the pairs whose alignment actually changed
+    are subtracted from and added to the counts again.
+
+    Args:
+        pairs: sequence of (word, misspelling)
+        symbols: the symbol table of the models, by default all
+            symbols in the pairs
+    Attributes:
+        counts: the current counts
+        symbols: the symbol table of the models
+    """
+
+    def __init__(self, pairs, symbols=None):
+        self.pairs = list(pairs)
+        self.alignments = [None] * len(self.pairs)
+        self.counts = {'': {'': 0}}
+        if symbols is None:
+            symbols = set(ch for s1, s2 in self.pairs for ch in s1 + s2)
+        self.symbols = sorted(symbols)
+        self._cost = None  # cost matrix of the current alignments
+        # lower bounds of the margins for the costs in _cost
+        self._margins = np.zeros(len(self.pairs))
+        # the alignments as indices into the (flattened) cost matrix
+        self._edits = [np.zeros(0, dtype=np.intp)] * len(self.pairs)
+        # the symbols (and '') of each word and misspelling as 0/1
+        # matrices, and the number of edits an alignment can have
+        ids = {sym: i for i, sym in enumerate([''] + self.symbols)}
+        self._ids = lambda ch: ids.get(ch, len(ids))
+        size = len(ids) + 1
+        self._rows = np.zeros((len(self.pairs), size))
+        self._columns = np.zeros((len(self.pairs), size))
+        self._rows[:, 0] = self._columns[:, 0] = 1
+        for p, (s1, s2) in enumerate(self.pairs):
+            self._rows[p, [self._ids(ch) for ch in s1]] = 1
+            self._columns[p, [self._ids(ch) for ch in s2]] = 1
+        self._lengths = np.array([len(s1) + len(s2) for s1, s2 in self.pairs], dtype=float)
+
+    def model(self):
+        """ Return the EditModel of the current counts.
+        """
+        return EditModel(self.counts, self.symbols)
+
+    def _affected(self, cost):
+        """ Return the indices of the pairs to realign for the costs in cost.
+
+        The alignment of a pair stays the best one if the margin
+        exceeds the change of its own cost plus the largest decrease
+        of the cost of any other alignment, which is at most its
+        number of edits times the largest decrease of a cost it can
+        use. The margins of the other pairs are lowered by this
+        amount, so they remain lower bounds for the new costs.
+        """
+        if self._cost is None:
+            return list(range(len(self.pairs)))
+        change = cost - self._cost
+        decrease = np.maximum(-change, 0)
+        largest = np.zeros(len(self.pairs))
+        for i in np.flatnonzero(decrease.any(axis=1)):
+            row = (self._columns * decrease[i]).max(axis=1)
+            largest = np.maximum(largest, self._rows[:, i] * row)
+        lengths = [len(edits) for edits in self._edits]
+        own = np.bincount(np.repeat(np.arange(len(self.pairs)), lengths),
+                          weights=change.ravel()[np.concatenate(self._edits)],
+                          minlength=len(self.pairs))
+        slack = own + self._lengths * largest
+        affected = self._margins <= slack
+        self._margins -= slack
+        return np.flatnonzero(affected).tolist()
+
+    def realign(self, model=None):
+        """ Align the pairs with the costs of model (unit costs if None).
+
+        Returns (delta, stats): the changes of the counts as a
+        dictionary {(ch1, ch2): change}, and a dictionary of
+        statistics with the number of pairs realigned and of pairs
+        whose alignment changed. The counts are not updated.
+        """
+        if model is None:
+            cost = 1 - np.eye(len(self.symbols) + 2)
+            indices = list(range(len(self.pairs)))
+        else:
+            cost = model.cost
+            indices = self._affected(cost)
+        self._cost = cost
+        delta = {}
+        changed = 0
+        if not indices:
+            return delta, {"realigned": 0, "changed": 0}
+        alignments, margins = align_batch([self.pairs[p] for p in indices], model,
+                                          margins=True)
+        size = cost.shape[1]
+        for p, edits, margin in zip(indices, alignments, margins):
+            self._margins[p] = margin
+            if edits == self.alignments[p]:
+                continue
+            changed += 1
+            for ch1, ch2 in self.alignments[p] or ():
+                delta[ch1, ch2] = delta.get((ch1, ch2), 0) - 1
+            for ch1, ch2 in edits:
+                delta[ch1, ch2] = delta.get((ch1, ch2), 0) + 1
+            self.alignments[p] = edits
+            self._edits[p] = np.array([self._ids(ch1) * size + self._ids(ch2)
+                                       for ch1, ch2 in edits], dtype=np.intp)
+        return delta, {"realigned": len(indices), "changed": changed}
+
+    def update(self, model=None):
+        """ Realign the pairs (see realign()) and update the counts.
+
+        Returns a dictionary of statistics: the number of pairs
+        realigned, of pairs whose alignment changed, and the total
+        absolute change of the counts.
+        """
+        delta, stats = self.realign(model)
+        add_delta(self.counts, delta)
+        stats["count_delta"] = sum(abs(n) for n in delta.values())
+        return stats
+
+
+def _counter_worker(conn, pairs, symbols):
+    """ Keep an EditCounter of a shard of the pairs, and answer each
+    model received on conn with the (delta, stats) of realigning it.
+    """
+    counter = EditCounter(pairs, symbols)
+    while True:
+        command, model = conn.recv()
+        if command == "stop":
+            break
+        conn.send(counter.realign(model))
+    conn.close()
+
+
+def train(pairs, processes=None, tol=0, max_iter=20, verbose=False):
+    """ Estimate edit counts from (word, misspelling) pairs.
+
+    Each iteration aligns the pairs with the costs estimated from the
+    counts of the previous one (the first uses unit costs), and
+    counts the aligned letters again. The pairs are split into one
+    shard for each of `processes` worker processes (default: number
+    of CPUs). Each worker keeps an EditCounter of its shard, so after
+    the first iteration only the pairs whose alignment may change
+    are aligned again, and only the alignments that changed are
+    counted again. We stop when the counts change by at most `tol`
+    in total or after `max_iter` iterations. With `verbose`, the
+    statistics of each iteration (see EditCounter.update()) are
+    printed.
+
+    The workers are forked, so they get their shard without copying
+    it, and the alignments stay in the workers: only the model and
+    the changes of the counts are sent between processes.
+    """
+    pairs = list(pairs)
+    if not pairs:
+        return {'': {'': 0}}
+    symbols = sorted(set(ch for s1, s2 in pairs for ch in s1 + s2))
+    context = multiprocessing.get_context("fork")
+    processes = max(1, min(processes or os.cpu_count() or 1, len(pairs)))
+    step = -(-len(pairs) // processes)
+    workers = []
+    try:
+        for start in range(0, len(pairs), step):
+            conn, child = context.Pipe()
+            worker = context.Process(target=_counter_worker,
+                                     args=(child, pairs[start:start + step], symbols),
+                                     daemon=True)
+            worker.start()
+            child.close()
+            workers.append((conn, worker))
+
+        counts = {'': {'': 0}}
+        model = None
+        for iteration in range(1, max_iter + 1):
+            for conn, _ in workers:
+                conn.send(("realign", model))
+            delta = {}
+            stats = {"realigned": 0, "changed": 0}
+            for conn, _ in workers:
+                part, part_stats = conn.recv()
+                for edit, n in part.items():
+                    delta[edit] = delta.get(edit, 0) + n
+                for key in stats:
+                    stats[key] += part_stats[key]
+            add_delta(counts, delta)
+            stats["count_delta"] = sum(abs(n) for n in delta.values())
+            if verbose:
+                print("iteration {}: realigned {realigned} pairs, {changed} changed, "
+                      "count delta {count_delta}".format(iteration, **stats))
+            if iteration > 1 and stats["count_delta"] <= tol:
+                break
+            model = EditModel(counts, symbols)
+    finally:
+        for conn, worker in workers:
+            try:
+                conn.send(("stop", None))
+            except OSError:
+                pass
+            conn.close()
+            worker.join()
     return counts
 
 
 if __name__ == "__main__":
     # The code below shows the intended use of your implementation above.
-    counts = None
-    counts_new = count_edits('spelling-data.txt')
-    while counts != counts_new:
-        counts = counts_new
-        counts_new = count_edits('spelling-data.txt', counts)
+    counts = train(read_pairs('spelling-data.txt'), verbose=True)
 
     with open('spell-errors.json', 'wt') as f:
-        json.dump(counts, f, ensure_ascii=False, indent=2)
\ No newline at end of file
+        json.dump(counts, f, ensure_ascii=False, indent=2)
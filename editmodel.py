@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Data Structures and Algorithms for CL 3, Project 1
+See <https://https://dsacl3-2022.github.io/p1/> for detailed instructions.
+Author:      Pun Ching Nei, Lorena Raichle, Kateryna Smykovska
+Honor Code:  I pledge that this program represents my work.
+We received help from: no one in designing and debugging our program.
+"""
+
+import numpy as np
+
+
+class EditModel:
+    """Smoothed edit probabilities compiled from edit counts.
+
+    The counts are the dictionary of dictionaries written by
+    compute-weights.py (counts[ch1][ch2] is the number of times ch1
+    was aligned with ch2, the empty string standing for insertions and
+    deletions). The probability of ch1 -> ch2 is estimated as
+
+        counts[ch1][ch2] / sum(counts[ch1])           if observed,
+        1 / (sum(counts[ch1]) + len(counts[ch1]))     if ch1 was seen,
+        1 / sum(all counts)                           otherwise.
+
+    The estimates are computed once for every pair of symbols and kept
+    in dense matrices, so looking one up takes constant time.
+
+    Args:
+        counts: the edit counts
+        symbols: the symbols to include, by default all symbols in counts
+    Attributes:
+        symbols: the symbol table, symbols[0] is the empty string.
+            One more row and column (index `unknown`) is used for any
+            symbol not in the table.
+        ids: symbol -> index in the matrices
+        prob: matrix of probabilities, prob[id(ch1), id(ch2)]
+        logprob: matrix of log probabilities
+        cost: matrix of costs 1 - p, as used for alignment
+    """
+
+    def __init__(self, counts, symbols=None):
+        if symbols is None:
+            symbols = set(counts)
+            for row in counts.values():
+                symbols.update(row)
+        symbols = set(symbols)
+        symbols.discard("")
+        self.symbols = ("",) + tuple(sorted(symbols))
+        self.ids = {sym: i for i, sym in enumerate(self.symbols)}
+        self.unknown = len(self.symbols)
+
+        size = len(self.symbols) + 1
+        observed = np.zeros((size, size))
+        seen = np.zeros((size, size), dtype=bool)
+        known_rows = np.zeros(size, dtype=bool)
+        total = 0
+        for ch1, row in counts.items():
+            i = self.ids.get(ch1, self.unknown)
+            known_rows[i] = i != self.unknown
+            for ch2, n in row.items():
+                total += n
+                if i != self.unknown:
+                    j = self.ids.get(ch2, self.unknown)
+                    observed[i, j] += n
+                    seen[i, j] = j != self.unknown
+        # all symbols not in the table share the last row and column,
+        # which only get the smoothed estimates
+        row_sum = np.array([sum(counts[ch1].values()) if known_rows[i] else 0
+                            for i, ch1 in enumerate(self.symbols + (None,))], dtype=float)
+        row_len = np.array([len(counts[ch1]) if known_rows[i] else 0
+                            for i, ch1 in enumerate(self.symbols + (None,))], dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            p = np.where(seen, observed / row_sum[:, None],
+                         1 / (row_sum + row_len)[:, None])
+            p[~known_rows] = 1 / total
+            self.prob = p
+            self.logprob = np.log(p)
+        self.cost = 1 - p
+        # nested lists are faster than the arrays for single lookups
+        self._logprob = self.logprob.tolist()
+        self._cost = self.cost.tolist()
+
+    def id(self, sym):
+        return self.ids.get(sym, self.unknown)
+
+    def weight(self, ch1, ch2):
+        """ Log probability of the edit ch1 -> ch2.
+        """
+        return self._logprob[self.id(ch1)][self.id(ch2)]
+
+    def edit_cost(self, ch1, ch2):
+        """ Alignment cost (1 - p) of the edit ch1 -> ch2.
+        """
+        return self._cost[self.id(ch1)][self.id(ch2)]
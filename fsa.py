@@ -6,7 +6,8 @@ Author:      Pun Ching Nei, Lorena Raichle, Kateryna Smykovska
 Honor Code:  I pledge that this program represents my work.
 We received help from: no one in designing and debugging our program.
 """
-import re
+import instrument
+
 
 class FSA:
     """ A class representing finite state automata.
@@ -32,6 +33,10 @@ class FSA:
         self.is_deterministic = deterministic
         self._alphabet = set()  # just for convenience, we can
         self._states = set()  # always read it off from transitions
+        # used by add_word() and remove_word(), built on first use
+        self._register = None  # (accepting, arcs) -> state
+        self._out = None  # state -> {sym: state}
+        self._in_degree = None  # state -> number of incoming arcs
 
     def add_transition(self, s1, sym, s2=None, accepting=False):
         """ Add an transition from state s1 to s2 with symbol
@@ -51,10 +56,22 @@ class FSA:
             self.accepting.add(s2)
         if len(self.transitions[(s1, sym)]) > 1:
             self.is_deterministic = False
+        self._register = None
         return s2
 
     def mark_accept(self, state):
         self.accepting.add(state)
+        self._register = None
+
+    def stats(self):
+        """ Return the number of states, arcs and symbols, and an
+        estimate of the memory used by the transitions in bytes.
+        """
+        return {"states": len(self._states),
+                "arcs": sum(len(s2s) for s2s in self.transitions.values()),
+                "accepting": len(self.accepting),
+                "symbols": len(self._alphabet),
+                "bytes": instrument.sizeof_transitions(self.transitions)}
 
     def is_accepting(self, state):
         return state in self.accepting
@@ -107,221 +124,451 @@ class FSA:
         else:
             return self._recognize_nfa(s)
 
-    def minimize(self):
+    def minimize(self, inplace=False):
         """ Minimize the automaton.
 
-        You are free to use any of the minimization algorithms here.
+        We use the partition refinement of Valmari and Lehtinen for
+        partial DFAs, which runs in O(m log n) for m transitions: like
+        Hopcroft's algorithm, but it only looks at the transitions
+        that exist, so there is no sink state and no table of
+        n * |alphabet| entries. Unreachable states and the states that
+        cannot reach an accepting state are dropped first (as
+        everywhere else, undefined transitions reject).
+
+        If 'inplace' is True the automaton itself is replaced by the
+        minimal one, otherwise a new FSA is returned. The states of the
+        result are numbered from 0 (the start state) in breadth-first
+        order.
+        """
+        if not self.is_deterministic:
+            raise ValueError("minimize() requires a deterministic FSA")
+        record = instrument.begin("minimize")
+        alphabet = sorted(self._alphabet)
+        label = {sym: a for a, sym in enumerate(alphabet)}
+        out = dict()  # state -> [(symbol index, state)]
+        for (s1, sym), s2s in self.transitions.items():
+            for s2 in s2s:
+                out.setdefault(s1, []).append((label[sym], s2))
+        # number the states reachable from the start state
+        index = {self.start_state: 0}
+        states = [self.start_state]
+        for s1 in states:
+            for _, s2 in out.get(s1, ()):
+                if s2 not in index:
+                    index[s2] = len(states)
+                    states.append(s2)
+        n = len(states)
+        # keep the states that can reach an accepting state
+        incoming = [[] for _ in range(n)]
+        for i, s1 in enumerate(states):
+            for _, s2 in out.get(s1, ()):
+                incoming[index[s2]].append(i)
+        live = [i for i, s in enumerate(states) if s in self.accepting]
+        final = len(live)
+        is_live = [False] * n
+        for i in live:
+            is_live[i] = True
+        for i in live:
+            for j in incoming[i]:
+                if not is_live[j]:
+                    is_live[j] = True
+                    live.append(j)
+
+        min_fsa = FSA(deterministic=True)
+        min_fsa.start_state = 0
+        min_fsa._states.add(0)
+        if not is_live[0]:  # the language is empty
+            blocks = None
+        else:
+            # the live states numbered 0..len(live)-1, accepting first
+            number = {i: q for q, i in enumerate(live)}
+            tails, labels, heads = [], [], []
+            for i in live:
+                for a, s2 in out.get(states[i], ()):
+                    if is_live[index[s2]]:
+                        tails.append(number[i])
+                        labels.append(a)
+                        heads.append(number[index[s2]])
+            blocks = _Partition(len(live))
+            blocks.mark(range(final))
+            blocks.split()
+            # the transitions, partitioned by label
+            cords = _Partition(len(tails), sorted(range(len(tails)), key=labels.__getitem__))
+            for i, t in enumerate(cords.elements):
+                if i and labels[t] != labels[cords.elements[i - 1]]:
+                    cords.split_at(i)
+            into = [[] for _ in live]
+            for t, q in enumerate(heads):
+                into[q].append(t)
+            # split the blocks by the tails of each cord, and the cords
+            # by the blocks of their heads; all but one initial block
+            # are enough as splitters
+            b, c = 1, 0
+            while c < cords.count:
+                if record is not None:
+                    record.expand(1)
+                blocks.mark([tails[t] for t in cords.elements[cords.first[c]:cords.past[c]]])
+                blocks.split()
+                c += 1
+                while b < blocks.count:
+                    cords.mark([t for q in blocks.elements[blocks.first[b]:blocks.past[b]]
+                                for t in into[q]])
+                    cords.split()
+                    b += 1
+
+            # build the quotient automaton, numbering the blocks
+            # breadth-first from the block of the start state
+            arcs = [[] for _ in live]  # state -> [(symbol index, state)]
+            for t, q in enumerate(tails):
+                arcs[q].append((labels[t], heads[t]))
+            block_of = blocks.set_of
+            start = number[0]
+            renumber = {block_of[start]: 0}
+            agenda = [start]
+            transitions = min_fsa.transitions
+            for q in agenda:
+                s1 = renumber[block_of[q]]
+                if q < final:
+                    min_fsa.accepting.add(s1)
+                for a, q2 in sorted(arcs[q]):
+                    b2 = block_of[q2]
+                    if b2 not in renumber:
+                        renumber[b2] = len(renumber)
+                        agenda.append(q2)
+                    transitions[s1, alphabet[a]] = {renumber[b2]}
+            min_fsa._states.update(range(len(renumber)))
+            min_fsa._alphabet.update(sym for _, sym in transitions)
+        if record is not None:
+            record.extra["states_before"] = n
+            record.extra["states_after"] = len(min_fsa._states)
+            record.extra["splits"] = blocks.count - 1 if blocks is not None else 0
+            instrument.end(record)
+        if inplace:
+            self.__dict__ = min_fsa.__dict__
+            return self
+        return min_fsa
+
+    def _signature(self, state):
+        return state in self.accepting, tuple(sorted(self._out[state].items()))
+
+    def _index(self):
+        """ Build the register of states and the arc index used by
+        add_word() and remove_word(), unless they are up to date.
         """
-        # minimization by partitioning
-        # construct a set of accepting and non-accepting states (0 equivalence)
-        transitions = m.transitions
-        print(transitions)
-        input_list = []
-        for item in m.transitions.keys():
-            if item[1] not in input_list:
-                input_list.append(item[1])
-        print(input_list)
-        accepting_states = set()  # final set of accepting states
-        non_accepting_states = set()
-        accept = m.accepting
-        # convert set of accepting states
-        for element in accept:
-            if isinstance(element, int):
-                accepting_states.add(element)
-            elif isinstance(element, frozenset) or isinstance(element, set):
-                for sub_element in element:
-                    if isinstance(sub_element, int):
-                        accepting_states.add(sub_element)
-        for i in range(max(accepting_states)):
-            if i not in accepting_states:
-                non_accepting_states.add(i)
-        # print("accepting states:")
-        # print(accepting_states)
-        # print("non accepting")
-        # print(non_accepting_states)
-
-        # 1 equivalence: check (first for non-accepting states: 0 and 1 with all possible inputs -> result in same set?)
-        list_accept = list(accepting_states)
-        list_non_accept = list(non_accepting_states)
-        dict_sets = []  # states that are not in the same set
-        input_idx = 0
-        # check for all possible inputs
-        while input_idx < len(input_list):
-            i = 0  # to get node (item 1) from sets
-            j = 1
-            # check for all non-accepting states
-            while j < len(list_non_accept):
-                set_non_accepting_1 = False
-                set_accepting_1 = False
-                set_non_accepting_2 = False
-                set_accepting_2 = False
-                # compare item by item from set of non-accepting states
-                item1 = list_non_accept[i]
-                item2 = list_non_accept[j]
-                res_item1 = 0
-                res_item2 = 0
-                # check in which set the ending state is for the respective input (for item 1) (0-w)
-                input = input_list[input_idx]
-                if (item1, input) not in m.transitions.keys():  # if not in dict...
-                    res_item1 = item1  # ... state stays same
-                else:  # if in dict...
-                    res_item1 = m.transitions[(item1, input)]
-                    res_item1 = int(list(res_item1)[0])
-                # ... check if ending state is in accepting / non-accepting set and update variable
-                if res_item1 in non_accepting_states:
-                    set_non_accepting_1 = True
-                else:
-                    set_accepting_1 = True
-                # check in which set the ending state is for the respective input (for item 2) (1-w)
-                if (item2, input) not in m.transitions.keys():  # if not in dict...
-                    res_item2 = item2  # ... state stays same
-                else:  # if in dict...
-                    res_item2 = m.transitions[(item2, input)]
-                    res_item2 = int(list(res_item2)[0])
-                # ... check if ending state is in accepting / non-accepting set and update variable
-                if res_item2 in non_accepting_states:
-                    set_non_accepting_2 = True
-                else:
-                    set_accepting_2 = True
-                # print("same set?")
-                # check if item 1 and item 2 are in the same set or in different sets
-                if set_non_accepting_1 and set_non_accepting_2 or set_accepting_1 and set_accepting_2:
-                    print(str(list_non_accept[i]) + " and " + str(
-                        list_non_accept[j]) + " are in same set!" + " for input: " + input)
-                else:
-                    if item1 not in dict_sets:
-                        dict_sets.append(item1)
-                    if item2 not in dict_sets:
-                        dict_sets.append(item2)
-                    # print(str(list_non_accept[i]) + " and " + str(
-                    #     list_non_accept[j]) + " are NOT in same set!" + " for input: " + input)
-                # check for similarity in sets
-                # k = 0
-                # l= 1
-                # if len(dict_sets) >= 2 and l <= len(dict_sets):
-                #     listing = []
-                #     if dict_sets[k] and dict_sets[l] not in list_non_accept:
-                #         if dict_sets[k] and dict_sets[l] not in list_accept:
-                #             listing = [dict_sets[l]]
-                #             dict_sets.append(listing)
-                #     k += 1
-                #     l += 1
-                # print(dict_sets)
-
-                # next item
-                j += 1
-            # next input
-            input_idx += 1
-        # print("reduction of the following states: ")
-        # print(dict_sets)
-        # reduction of the states in the trie
-        min_trie = FSA(deterministic=True)
-        for key in m.transitions.keys():
-            if key[0] not in dict_sets:
-                sym = m.transitions[(key[0], key[1])]
-                sym = int(list(sym)[0])
-                min_trie.add_transition(key[0], key[1], sym)
-                if sym in accepting_states:
-                    min_trie.mark_accept(sym)
-        # print(min_trie.transitions)
-        return min_trie
+        if self._register is not None:
+            return
+        if not self.is_deterministic:
+            raise ValueError("add_word() and remove_word() require a deterministic FSA")
+        self._out = {state: {} for state in self._states}
+        self._in_degree = dict.fromkeys(self._states, 0)
+        for (s1, sym), s2s in self.transitions.items():
+            s2 = next(iter(s2s))
+            self._out[s1][sym] = s2
+            self._in_degree[s2] += 1
+        self._register = dict()
+        for state in self._states:
+            if state == self.start_state:
+                continue
+            key = self._signature(state)
+            if key in self._register:
+                self._register = None
+                raise ValueError("add_word() and remove_word() require a minimal FSA")
+            self._register[key] = state
+
+    def _set_arc(self, s1, sym, s2):
+        old = self._out[s1].get(sym)
+        if old is not None:
+            self._in_degree[old] -= 1
+        self._out[s1][sym] = s2
+        self._in_degree[s2] += 1
+        self.transitions[(s1, sym)] = {s2}
+        self._alphabet.add(sym)
+
+    def _delete_arc(self, s1, sym):
+        self._in_degree[self._out[s1].pop(sym)] -= 1
+        del self.transitions[(s1, sym)]
+
+    def _new_state(self, arcs=(), accepting=False):
+        state = len(self._states)
+        while state in self._states: state += 1
+        self._states.add(state)
+        self._out[state] = {}
+        self._in_degree[state] = 0
+        for sym, s2 in arcs:
+            self._set_arc(state, sym, s2)
+        if accepting:
+            self.accepting.add(state)
+        return state
+
+    def _delete_state(self, state):
+        for sym in list(self._out[state]):
+            self._delete_arc(state, sym)
+        del self._out[state]
+        del self._in_degree[state]
+        self._states.discard(state)
+        self.accepting.discard(state)
+
+    def _unshare_path(self, word):
+        """ Return the states along the longest prefix of word in the
+        automaton, made private to this path.
+
+        The states on the path are removed from the register, as we
+        are going to change them. From the first state with more than
+        one incoming arc on, the states are cloned, so that the change
+        does not affect the other words going through them.
+        """
+        path = [self.start_state]
+        for sym in word:
+            s2 = self._out[path[-1]].get(sym)
+            if s2 is None:
+                break
+            path.append(s2)
+        cloning = False
+        for i in range(1, len(path)):
+            state = path[i]
+            cloning = cloning or self._in_degree[state] > 1
+            if cloning:
+                path[i] = self._new_state(self._out[state].items(), state in self.accepting)
+                self._set_arc(path[i - 1], word[i - 1], path[i])
+            elif self._register.get(self._signature(state)) == state:
+                del self._register[self._signature(state)]
+        return path
+
+    def _replace_or_register(self, path, word):
+        """ Restore minimality after the states along path changed.
+
+        From the end of the path backwards, a state without arcs that
+        is not accepting is removed, a state equivalent to a registered
+        one is replaced by it, and any other state is registered.
+        """
+        for i in range(len(path) - 1, 0, -1):
+            state = path[i]
+            if not self._out[state] and state not in self.accepting:
+                self._delete_arc(path[i - 1], word[i - 1])
+                self._delete_state(state)
+                continue
+            key = self._signature(state)
+            other = self._register.get(key)
+            if other is None:
+                self._register[key] = state
+            elif other != state:
+                self._set_arc(path[i - 1], word[i - 1], other)
+                self._delete_state(state)
+
+    def add_word(self, word):
+        """ Add word to a minimal acyclic FSA, keeping it minimal.
+
+        This is the incremental construction of Carrasco and Forcada
+        (2002): only the states along the path of word are cloned,
+        created, merged or removed, so the cost depends on the length
+        of the word, not on the size of the automaton (except for the
+        first call, which indexes the automaton).
+
+        Returns the set of states whose arcs or acceptance changed,
+        including the new states and the removed ones (which are no
+        longer in the automaton). The set is empty if word was already
+        in the language.
+        """
+        self._index()
+        if self.recognize(word):
+            return set()
+        path = self._unshare_path(word)
+        for sym in word[len(path) - 1:]:
+            state = self._new_state()
+            self._set_arc(path[-1], sym, state)
+            path.append(state)
+        self.accepting.add(path[-1])
+        changed = set(path)
+        self._replace_or_register(path, word)
+        return changed
+
+    def remove_word(self, word):
+        """ Remove word from a minimal acyclic FSA, keeping it minimal.
+
+        See add_word(), the return value is the same. The set is empty
+        if word was not in the language.
+        """
+        self._index()
+        if not self.recognize(word):
+            return set()
+        path = self._unshare_path(word)
+        self.accepting.discard(path[-1])
+        changed = set(path)
+        self._replace_or_register(path, word)
+        return changed
+
+
+class _Partition:
+    """ A partition of range(n), refined by marking elements and then
+    splitting the marked elements of each set off into a new set
+    (Valmari and Lehtinen, "Efficient minimization of DFAs with
+    partial transition functions", 2008).
+
+    The elements are kept in 'elements' ordered by set, set s being
+    elements[first[s]:past[s]] with its marked elements in front, so
+    marking and splitting take time in the number of marked elements.
+    """
+
+    def __init__(self, n, elements=None):
+        self.elements = list(range(n)) if elements is None else elements
+        self.location = [0] * n
+        for i, e in enumerate(self.elements):
+            self.location[e] = i
+        self.set_of = [0] * n
+        self.first = [0] * max(n, 1)
+        self.past = [n] + [0] * (n - 1)
+        self.count = 1 if n else 0
+        self._marked = [0] * max(n, 1)
+        self._touched = []
+
+    def mark(self, es):
+        """ Mark the (unmarked) elements es.
+        """
+        elements, location, set_of = self.elements, self.location, self.set_of
+        first, marked, touched = self.first, self._marked, self._touched
+        for e in es:
+            s = set_of[e]
+            i = location[e]
+            j = first[s] + marked[s]
+            other = elements[j]
+            elements[i] = other
+            location[other] = i
+            elements[j] = e
+            location[e] = j
+            if not marked[s]:
+                touched.append(s)
+            marked[s] += 1
+
+    def split_at(self, i):
+        """ Split elements[i:] (of the last set) off into a new set.
+        """
+        s = self.count - 1
+        z = self.count
+        self.first[z], self.past[z] = i, self.past[s]
+        self.past[s] = i
+        for j in range(i, self.past[z]):
+            self.set_of[self.elements[j]] = z
+        self.count += 1
+
+    def split(self):
+        """ Split the marked elements of each set off into a new set
+        (the unmarked ones, if they are fewer), and unmark them.
+        """
+        while self._touched:
+            s = self._touched.pop()
+            j = self.first[s] + self._marked[s]
+            if j == self.past[s]:  # all elements marked
+                self._marked[s] = 0
+                continue
+            z = self.count
+            if self._marked[s] <= self.past[s] - j:
+                self.first[z] = self.first[s]
+                self.past[z] = self.first[s] = j
+            else:
+                self.past[z] = self.past[s]
+                self.first[z] = self.past[s] = j
+            for i in range(self.first[z], self.past[z]):
+                self.set_of[self.elements[i]] = z
+            self._marked[s] = self._marked[z] = 0
+            self.count += 1
+
+
+def _register_state(dawg, register, node):
+    """ Return the state of 'dawg' equivalent to the finished 'node'.
+
+    A node is a list [edges, accepting] whose edges already point to
+    registered states. If an equivalent state (same accepting flag and
+    same outgoing arcs) is in 'register' it is reused, otherwise the
+    node is added to 'dawg' as a new state.
+    """
+    edges, accepting = node
+    key = (accepting, tuple(sorted(edges.items())))
+    state = register.get(key)
+    if state is None:
+        state = len(register) + 1  # state 0 is the start state
+        register[key] = state
+        dawg._states.add(state)
+        for sym, s2 in edges.items():
+            dawg.add_transition(state, sym, s2)
+        if accepting:
+            dawg.mark_accept(state)
+    return state
+
+
+def build_dawg(words):
+    """Given a sorted sequence of words, create and return a minimal FSA.
+
+    This is the incremental construction of Daciuk et al. (2000) for
+    sorted input. Only the path of the previous word is kept in memory
+    as unfinished nodes. When the next word diverges from it, the
+    nodes below the common prefix can no longer change, so they are
+    replaced by an equivalent state of the automaton if one exists, or
+    registered as new states otherwise. The result is a minimal,
+    acyclic and deterministic FSA built in a single pass.
+
+    Duplicate words are ignored; words out of lexicographic order
+    raise a ValueError.
+    """
+    record = instrument.begin("build_trie")
+    dawg = FSA(deterministic=True)
+    dawg.start_state = 0
+    dawg._states.add(0)
+    register = {}  # (accepting, arcs) -> state
+    path = [[{}, False]]  # unfinished nodes along the previous word
+    prev = None
+    for word in words:
+        if prev is not None:
+            if word == prev:
+                continue
+            if word < prev:
+                raise ValueError("words are not sorted: {!r} after {!r}"
+                                 .format(word, prev))
+            common = 0
+            while (common < len(prev) and common < len(word)
+                   and prev[common] == word[common]):
+                common += 1
+            # the suffix of the previous word is finished now
+            for i in range(len(prev), common, -1):
+                node = path.pop()
+                path[-1][0][prev[i - 1]] = _register_state(dawg, register, node)
+                if record is not None:
+                    record.expand()
+        else:
+            common = 0
+        for char in word[common:]:
+            node = [{}, False]
+            path[-1][0][char] = None  # set when the node is registered
+            path.append(node)
+        path[-1][1] = True
+        prev = word
+        if record is not None:
+            record.extra["words"] = record.extra.get("words", 0) + 1
+            record.agenda_peak = max(record.agenda_peak, len(path))
+    if prev is not None:
+        for i in range(len(prev), 0, -1):
+            node = path.pop()
+            path[-1][0][prev[i - 1]] = _register_state(dawg, register, node)
+            if record is not None:
+                record.expand()
+    edges, accepting = path[0]
+    for sym, s2 in edges.items():
+        dawg.add_transition(0, sym, s2)
+    if accepting:
+        dawg.mark_accept(0)
+    if record is not None:
+        record.extra["states"] = len(dawg._states)
+        instrument.end(record)
+    return dawg
 
 
 def build_trie(words):
     """Given a list of words, create and return a trie FSA.
 
-    For the given sequence of words, you should build a trie,
-    an FSA where letters are the edge labels. Since the structure is a
-    trie, common prefix paths should be shared but suffixes will
-    necessarily use many redundant paths.
-
-    You should initialize an instance of the FSA class defined above,
-    and add only the required arcs successively.
+    The words do not need to be sorted or unique. They are passed to
+    build_dawg(), so that common suffixes are shared as well as
+    common prefixes, and the returned FSA is already minimal.
     """
-    my_trie = FSA(deterministic=True)
-    # TO DELETE:
-    transitions = my_trie.transitions
-    node_count = 0  # (node count = character position in word)
-    my_trie.start_state = node_count
-    sorted_words = sorted(words, key=len,
-                          reverse=True)  # sorted list from longest to shortest string to insert into trie
-    real_node = len(sorted_words[0])  # keep track of the (ordered) number of nodes in the trie
-    dict_tokens = {}  # dict to keep track of each token with it's last node count of the row / keep track of stem (longest word first inserted)
-    prev_token = ""  # keep track of previously processed token of list
-    for token in sorted_words:  # process word by word, character by character
-        new_string = False
-        for char in token:
-            # if input is not in transitions dict / trie...
-            if (node_count, char) not in my_trie.transitions or new_string:
-                last_word_length = len(sorted_words[0])  # word length of last token
-                if len(token) < last_word_length:  # if token length smaller, reaching a side branch of the trie...
-                    last_word_length = len(token)
-                    node_count = dict_tokens[prev_token] + 1  # ... therefore adapt node_count
-            # check again (aslo for updated node count if side branch of trie is reached) if already in trie
-            if (node_count, char) not in my_trie.transitions or new_string:
-                tmp = list(my_trie.transitions.keys())
-                res = [x for x, _ in tmp]  # list of node counts
-                # check if node_count is already in dict but with another character
-                # -> a new transition + node has to be added after the last node
-                if node_count in res:
-                    # connect to last node of new string
-                    if new_string:
-                        my_trie.add_transition(len(res), char, len(res) + 1, accepting=False)
-                        node_count += 1
-                    else:
-                        # connect to node count
-                        my_trie.add_transition(node_count, char, len(res) + 1, accepting=False)
-                        node_count += 1
-                        new_string = True  # a new string (and not only a prefix-string) is inserted to the trie
-                else:  # if node_count did not appear in the node count list (res), add
-                    my_trie.add_transition(node_count, char, len(res) + 1, accepting=False)
-                    node_count += 1
-                    new_string = True
-                    # dict to keep track of stem
-                    dict_tokens[char] = node_count  # add current char and node count to dict
-            else:  # if char in string / if already in dict
-                node_count += 1
-
-        # if char is at last position of string, mark as accepting state
-        if char is token[-1]:
-            if new_string:  # whole string (last) walks, walls, wants, works, forks
-                my_trie.mark_accept(len(res) + 1)
-                last_accepting = (len(res) + 1)
-            elif real_node > len(sorted_words[0]):  # prefix string: walk, wall, want
-                mark = my_trie.transitions[(node_count - 1, token[-1])]
-                my_trie.mark_accept(frozenset(mark))
-                for item in frozenset(mark):
-                    last_accepting = item
-            # update the count in dict_token (to achieve correct accepting state for prefix strings already in trie)
-            dict_tokens[token] = last_accepting
-            keys = dict_tokens.keys()
-            key = ""
-            for token in keys:
-                key += token + " "
-            if len(token) < len(sorted_words[0]):
-                match = re.search(token, key)
-                if match:
-                    start_index = match.start()
-                    end_index = key.find(" ", start_index)
-                    word = key[start_index:end_index]
-                    res = dict_tokens[word]
-                    dict_tokens[token] = res
-
-        real_node += 1
-        prev_token = token
-        node_count = 0
-    accept = my_trie.accepting
-    # convert set of accepting states
-    int_set = set()  # final set of accepting states
-    for element in accept:
-        if isinstance(element, int):
-            int_set.add(element)
-        elif isinstance(element, frozenset) or isinstance(element, set):
-            for sub_element in element:
-                if isinstance(sub_element, int):
-                    int_set.add(sub_element)
-
-    return my_trie
+    return build_dawg(sorted(set(words)))
 
 
 if __name__ == '__main__':
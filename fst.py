@@ -6,6 +6,24 @@ Author:      Pun Ching Nei, Lorena Raichle, Kateryna Smykovska
 Honor Code:  I pledge that this program represents my work.
 We received help from: no one in designing and debugging our program.
 """
+import heapq
+import json
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+import numpy as np
+
+import instrument
+
+FILE_MAGIC = b"FSTSPELL"
+FILE_VERSION = 1
+
+OPTIMIZE_PASSES = ("connect", "rmepsilon", "determinize", "push_weights")
 
 
 class FST:
@@ -14,11 +32,17 @@ class FST:
 
     def __init__(self):
         self.transitions = dict()
+        # per-state index of the same arc sets as in 'transitions':
+        # s1 -> {insym: set()} without the epsilon arcs, which are
+        # kept separately as s1 -> set()
+        self._arcs = dict()
+        self._epsilon_arcs = dict()
         self.start_state = None
         self.accepting = set()
         self._sigma_in = set()
         self._sigma_out = set()
         self._states = set([0])
+        self.version = 0  # changed by every modification
 
     @classmethod
     def fromfsa(cls, fsa):
@@ -37,18 +61,47 @@ class FST:
 
     def mark_accepting(self, state):
         self.accepting.add(state)
+        self.version += 1
 
-    def get_transitions(self, s1, insym=None):
+    def stats(self):
+        """ Return the number of states, arcs and symbols, and an
+        estimate of the memory used by the transitions in bytes.
         """
+        return {"states": len(self._states),
+                "arcs": sum(len(targets) for targets in self.transitions.values()),
+                "accepting": len(self.accepting),
+                "input_symbols": len(self._sigma_in),
+                "output_symbols": len(self._sigma_out),
+                "bytes": (instrument.sizeof_transitions(self.transitions)
+                          + sys.getsizeof(self._arcs) + sys.getsizeof(self._epsilon_arcs)
+                          + sum(sys.getsizeof(index) for index in self._arcs.values()))}
+
+    def is_accepting(self, state):
+        return state in self.accepting
+
+    def arcs(self, s1):
+        """ Yield all transitions leaving s1 as (insym, outsym, s2, w).
         """
-        if insym is None:
-            syms = self._sigma_in
+        for outsym, s2, w in self._epsilon_arcs.get(s1, ()):
+            yield "", outsym, s2, w
+        for sym, targets in self._arcs.get(s1, {}).items():
+            for outsym, s2, w in targets:
+                yield sym, outsym, s2, w
+
+    def get_transitions(self, s1, insym=None):
+        """ Yield (s2, outsym, w) for the transitions leaving s1,
+        only those with input 'insym' if it is given.
+        """
+        if insym == "":
+            targets = self._epsilon_arcs.get(s1, ())
+        elif insym is not None:
+            targets = self.transitions.get((s1, insym), ())
         else:
-            syms = (insym,)
-        for sym in syms:
-            if (s1, sym) in self.transitions:
-                for outsym, s2, w in self.transitions[(s1, sym)]:
-                    yield s2, outsym, w
+            for _, outsym, s2, w in self.arcs(s1):
+                yield s2, outsym, w
+            return
+        for outsym, s2, w in targets:
+            yield s2, outsym, w
 
     def add_transition(self, s1, insym,
                        s2=None, outsym=None, w=0, accepting=False):
@@ -73,10 +126,16 @@ class FST:
         self._sigma_in.add(insym)
         self._sigma_out.add(outsym)
         if (s1, insym) not in self.transitions:
-            self.transitions[(s1, insym)] = set()
+            targets = set()
+            self.transitions[(s1, insym)] = targets
+            if insym == "":
+                self._epsilon_arcs[s1] = targets
+            else:
+                self._arcs.setdefault(s1, {})[insym] = targets
         self.transitions[s1, insym].add((outsym, s2, w))
         if accepting:
             self.accepting.add(s2)
+        self.version += 1
         return s2
 
     def move(self, s1, insym):
@@ -111,51 +170,176 @@ class FST:
               an acceptable string. We want to generate all possible
               paths.
         """
-        def recursive_transduce(input_string, current_state, output_string, output_string_container, total_weight):
-
-            if input_string == "" and current_state in self.accepting: # base case
-                output_string_container.append((output_string, total_weight))
-            if (current_state, input_string[:1]) in self.transitions: # get the path for each value of the key
-                for value in self.transitions[(current_state, input_string[:1])]: # save each part of output
-                    output_string += value[0]
-                    next_state = value[1]
-                    total_weight += value[2]
-                    recursive_transduce(input_string[1:], next_state, output_string, output_string_container, total_weight)
-                    if value[0] != "":  # not deleting the first character while back-tracking
-                        output_string = output_string[:-1]
-                    total_weight -= value[2] # subtract the weight while back-tracking
-            if input_string[:1] != "" and (current_state, "") in self.transitions: # deal with case that the input string is epsilon
-                for value in self.transitions[(current_state, "")]:# save each part of output
-                    output_string += value[0]
-                    next_state = value[1]
-                    total_weight += value[2]
-                    recursive_transduce(input_string, next_state, output_string, output_string_container, total_weight)
-                    if value[0] != "": # not deleting the first character while back-tracking
-                        output_string = output_string[:-1]
-                    total_weight -= value[2] # subtract the weight while back-tracking
-
-        container = []
-        recursive_transduce(s, self.start_state, "", container, 0)
-        return container
+        return list(self.transduce_iter(s))
+
+    def transduce_iter(self, s):
+        """ Yield the (output, weight) pairs of transduce() one by one.
+
+        The paths are followed depth-first with an explicit stack of
+        (state, input position, output, weight), so long inputs do not
+        run into the recursion limit, and the caller only pays for the
+        results it actually consumes (e.g. next() to get any result).
+        """
+        record = instrument.begin("transduce")
+        get_transitions = self.get_transitions
+        if record is not None:
+            get_transitions = record.counting(get_transitions)
+        stack = [(self.start_state, 0, "", 0)]
+        try:
+            while stack:
+                if record is not None:
+                    record.expand(len(stack))
+                state, pos, output, weight = stack.pop()
+                if pos == len(s) and self.is_accepting(state):
+                    yield output, weight
+                for next_state, outsym, w in get_transitions(state, ""):
+                    stack.append((next_state, pos, output + outsym, weight + w))
+                if pos < len(s):
+                    for next_state, outsym, w in get_transitions(state, s[pos]):
+                        stack.append((next_state, pos + 1, output + outsym, weight + w))
+        finally:
+            if record is not None:
+                instrument.end(record)
+
+    def transduce_lattice(self, s, combine=max):
+        """ Transduce s by dynamic programming over a lattice.
+
+        The lattice has a node for each (state, input position) we can
+        reach while reading s, and each node is expanded only once no
+        matter how many paths lead to it. Then, from the end backwards,
+        we compute for each node the outputs it can still produce with
+        their weights, so a node shared by many paths is also solved
+        only once.
+
+        Returns a list of (output, weight) pairs, one for each distinct
+        output. The weights of different paths with the same output are
+        merged with 'combine': the default max keeps the best path,
+        np.logaddexp would give the total (log) probability.
+        As for transduce(), the FST should not have epsilon loops.
+        """
+        record = instrument.begin("transduce_lattice")
+        get_transitions = self.get_transitions
+        if record is not None:
+            get_transitions = record.counting(get_transitions)
+        start = (self.start_state, 0)
+        lattice = dict()  # (state, pos) -> [((state, pos), outsym, w)]
+        agenda = [start]
+        while agenda:
+            node = agenda.pop()
+            if node in lattice:
+                continue
+            if record is not None:
+                record.expand(len(agenda) + 1)
+            state, pos = node
+            arcs = [((s2, pos), outsym, w)
+                    for s2, outsym, w in get_transitions(state, "")]
+            if pos < len(s):
+                arcs.extend(((s2, pos + 1), outsym, w)
+                            for s2, outsym, w in get_transitions(state, s[pos]))
+            lattice[node] = arcs
+            agenda.extend(n for n, _, _ in arcs if n not in lattice)
+
+        # outputs[node] = {output suffix: weight} for the paths from
+        # node to an accepting state at the end of the input, filled
+        # in post-order (children first) with an explicit stack
+        outputs = dict()
+        stack = [(start, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if node in outputs:
+                continue
+            if not children_done:
+                stack.append((node, True))
+                stack.extend((n, False) for n, _, _ in lattice[node] if n not in outputs)
+                continue
+            table = dict()
+            if node[1] == len(s) and self.is_accepting(node[0]):
+                table[""] = 0
+            for n, outsym, w in lattice[node]:
+                for suffix, w2 in outputs[n].items():
+                    out = outsym + suffix
+                    if out in table:
+                        table[out] = combine(table[out], w + w2)
+                    else:
+                        table[out] = w + w2
+            outputs[node] = table
+        if record is not None:
+            record.extra["lattice_nodes"] = len(lattice)
+            instrument.end(record)
+        return list(outputs[start].items())
+
+    def transduce_nbest(self, s, n, max_cost=None):
+        """ Return the n best distinct outputs for the string s.
+
+        The result is a list of (output, weight) pairs, the best (the
+        highest weight) first. Weights are summed along the path as in
+        transduce(), and they are assumed to be log probabilities
+        (never positive), so that the cost -weight of a path never
+        decreases as it grows. This lets us run a best-first (Dijkstra)
+        search over (state, input position, output) with a priority
+        queue and stop as soon as n different outputs were accepted,
+        instead of generating all paths. Paths with a cost higher than
+        'max_cost' are not explored.
+        """
+        record = instrument.begin("transduce_nbest")
+        get_transitions = self.get_transitions
+        if record is not None:
+            get_transitions = record.counting(get_transitions)
+        results = []
+        found = set()
+        done = set()
+        counter = 0  # breaks ties in the queue without comparing states
+        agenda = [(0, counter, self.start_state, 0, "")]
+        while agenda and len(results) < n:
+            cost, _, state, pos, output = heapq.heappop(agenda)
+            if (state, pos, output) in done:
+                continue
+            if record is not None:
+                record.expand(len(agenda) + 1)
+            done.add((state, pos, output))
+            if pos == len(s) and output not in found and self.is_accepting(state):
+                found.add(output)
+                results.append((output, -cost))
+            steps = [(pos, get_transitions(state, ""))]
+            if pos < len(s):
+                steps.append((pos + 1, get_transitions(state, s[pos])))
+            for next_pos, transitions in steps:
+                for next_state, outsym, w in transitions:
+                    next_cost = cost - w
+                    if max_cost is not None and next_cost > max_cost:
+                        continue
+                    counter += 1
+                    heapq.heappush(agenda, (next_cost, counter, next_state,
+                                            next_pos, output + outsym))
+        if record is not None:
+            instrument.end(record)
+        return results
 
     def invert(self):
-        """Invert the FST.
+        """Invert the FST in place, swapping the input and output labels.
+
+        The states, the start state and the weights do not change.
+        Returns the FST itself for convenience.
         """
+        record = instrument.begin("invert")
         invert_fst = FST()
 
         # mark the accepting state of the inverted version
         invert_fst.accepting = self.accepting
-        # invert_fst._sigma_in = self._sigma_out
-        # invert_fst._sigma_out = self._sigma_out
 
-        # exchange the s1 and s2 place to invert the fst
+        # exchange the input and output symbols to invert the fst
         for (s1, insym), s2_total in self.transitions.items():
             for outsym, s2, w in s2_total:
-                invert_fst.add_transition(s2, outsym, s1, insym, w)
+                invert_fst.add_transition(s1, outsym, s2, insym, w)
+        invert_fst.start_state = self.start_state
+        invert_fst._states = self._states
+        invert_fst.version = self.version + 1
 
         self.__dict__ = invert_fst.__dict__
-
-
+        if record is not None:
+            record.extra["arcs"] = sum(len(targets) for targets in self.transitions.values())
+            instrument.end(record)
+        return self
 
     @classmethod
     def compose_fst(cls, m1, m2):
@@ -168,54 +352,839 @@ class FST:
         since `m1` in our application is not weighted, the arc weight
         can trivially be taken from `m2`.
         """
+        record = instrument.begin("compose_fst")
+        arcs1, get_transitions2 = m1.arcs, m2.get_transitions
+        if record is not None:
+            arcs1 = record.counting(arcs1)
+            get_transitions2 = record.counting(get_transitions2)
         compose = FST()
         start_state1 = m1.start_state
         start_state2 = m2.start_state
-        sigmain1 = m1._sigma_in
 
         # make the start state
         new_start_state = (start_state1, start_state2)
         compose.start_state = new_start_state
+        if m1.is_accepting(start_state1) and m2.is_accepting(start_state2):
+            compose.mark_accepting(new_start_state)
 
         agenda = [new_start_state]
-        visited = set()
+        visited = set([new_start_state])
 
         # start to do compose
         while agenda:
+            if record is not None:
+                record.expand(len(agenda))
             temp = agenda.pop()
-            visited.add(temp)
-            # looping all pairs of transitions (non-epsilon part)
-            for y in sigmain1:
-                if (temp[0], y) in m1.transitions and (temp[1], y) in m2.transitions:
-                    # loop all possible answer in m1
-                    for path1, state1, weight1 in m1.transitions[temp[0], y]:
-                        # loop all possible answer in m2
-                        for path2, state2, weight2 in m2.transitions[temp[1], path1]:
-                            # add transition for the pairs
-                            end_state = False
-                            if state1 in m1.accepting and state2 in m2.accepting:
-                                end_state = True
-                            compose.add_transition(temp, y, (state1, state2), path2, weight2, accepting=end_state)
-                            # add pair to agenda if it is not in visited
-                            if (state1, state2) not in visited:
-                                agenda.append((state1, state2))
-            # looping all pairs of transitions (epsilon part)
-            # if the pair of m2 transition is empty string
-            if (temp[1], "") in m2.transitions:
-                # starting state
-                state1 = temp[0]
-                for path2, state2, weight2 in m2.transitions[(temp[1], "")]:
-                    # add transition for the pairs
-                    end_state = False
-                    if state1 in m1.accepting and state2 in m2.accepting:
-                        end_state = True
-                    compose.add_transition(temp, "", (state1, state2), path2, weight2, accepting=end_state)
-                    # add pair to agenda if it is not in visited
-                    if (state1, state2) not in visited:
-                        agenda.append((state1, state2))
+            for y, path2, state, weight2 in cls._compose_arcs(m1, m2, temp, arcs1,
+                                                              get_transitions2):
+                # add transition for the pairs
+                end_state = False
+                if m1.is_accepting(state[0]) and m2.is_accepting(state[1]):
+                    end_state = True
+                compose.add_transition(temp, y, state, path2, weight2, accepting=end_state)
+                # add pair to agenda if it is not in visited
+                if state not in visited:
+                    visited.add(state)
+                    agenda.append(state)
 
+        if record is not None:
+            record.extra["states"] = len(visited)
+            instrument.end(record)
         return compose
 
+    @staticmethod
+    def _compose_arcs(m1, m2, temp, arcs1, get_transitions2):
+        """ Yield the transitions leaving the pair of states temp in the
+        composition of m1 and m2 as (insym, outsym, s2, w).
+        """
+        # looping all pairs of transitions (non-epsilon part)
+        for y, path1, state1, weight1 in arcs1(temp[0]):
+            # loop all possible answer in m2
+            for state2, path2, weight2 in get_transitions2(temp[1], path1):
+                yield y, path2, (state1, state2), weight2
+        # looping all pairs of transitions (epsilon part)
+        # if the pair of m2 transition is empty string
+        state1 = temp[0]
+        for state2, path2, weight2 in get_transitions2(temp[1], ""):
+            yield "", path2, (state1, state2), weight2
+
+    def remove_arcs(self, s1):
+        """ Remove all transitions leaving s1.
+        """
+        for insym in self._arcs.pop(s1, {}):
+            del self.transitions[s1, insym]
+        if self._epsilon_arcs.pop(s1, None) is not None:
+            del self.transitions[s1, ""]
+        self.version += 1
+
+    def recompose(self, m1, m2, states, inverted=False):
+        """Update a composition of m1 and m2 after some states of m1 changed.
+
+        The FST should have been made by compose_fst(m1, m2) (and then
+        inverted if 'inverted' is True). 'states' are the states of m1
+        whose arcs or acceptance changed, including new states and the
+        states removed from m1._states. The arcs of the pairs (q1, q2)
+        with q1 in 'states' are computed again, the new pairs they
+        reach are expanded as in compose_fst(), and the pairs of
+        removed states are dropped. The rest of the composition is not
+        touched. Returns the number of pairs expanded.
+        """
+        record = instrument.begin("recompose")
+        agenda = []
+        for q1 in states:
+            for q2 in m2._states | {m2.start_state}:
+                pair = (q1, q2)
+                if pair not in self._states and pair != self.start_state:
+                    continue
+                self.remove_arcs(pair)
+                if q1 in m1._states or q1 == m1.start_state:
+                    if m1.is_accepting(q1) and m2.is_accepting(q2):
+                        self.accepting.add(pair)
+                    else:
+                        self.accepting.discard(pair)
+                    agenda.append(pair)
+                else:
+                    self._states.discard(pair)
+                    self.accepting.discard(pair)
+        expanded = 0
+        while agenda:
+            if record is not None:
+                record.expand(len(agenda))
+            pair = agenda.pop()
+            expanded += 1
+            for insym, outsym, state, w in self._compose_arcs(m1, m2, pair, m1.arcs,
+                                                              m2.get_transitions):
+                if state not in self._states and state != self.start_state:
+                    agenda.append(state)
+                if inverted:
+                    insym, outsym = outsym, insym
+                self.add_transition(pair, insym, state, outsym, w,
+                                    accepting=m1.is_accepting(state[0])
+                                    and m2.is_accepting(state[1]))
+        if record is not None:
+            record.extra["expanded"] = expanded
+            instrument.end(record)
+        return expanded
+
+    def _end_pass(self, record, result):
+        if record is not None:
+            record.extra["states_before"] = len(self._states)
+            record.extra["states_after"] = len(result._states)
+            record.extra["arcs_before"] = sum(len(t) for t in self.transitions.values())
+            record.extra["arcs_after"] = sum(len(t) for t in result.transitions.values())
+            instrument.end(record)
+        return result
+
+    def connect(self, report=None):
+        """Return the FST without useless states, renumbered from 0.
+
+        A state is kept if it is reachable from the start state and
+        can reach an accepting state, all other states and their arcs
+        are removed. The states are numbered with integers in the order
+        a breadth-first search from the start state (0) finds them,
+        which replaces the nested tuples left by compose_fst(). If
+        'report' is a list, {"pass": "connect", "before": stats(),
+        "after": stats()} is appended to it.
+        """
+        record = instrument.begin("connect")
+        reverse = dict()  # s2 -> {s1}
+        for (s1, insym), targets in self.transitions.items():
+            for outsym, s2, w in targets:
+                reverse.setdefault(s2, set()).add(s1)
+        coaccessible = set(self.accepting)
+        agenda = list(coaccessible)
+        while agenda:
+            for s1 in reverse.get(agenda.pop(), ()):
+                if s1 not in coaccessible:
+                    coaccessible.add(s1)
+                    agenda.append(s1)
+
+        result = FST()
+        result.start_state = 0
+        number = {self.start_state: 0}
+        states = [self.start_state]
+        if self.start_state not in coaccessible:  # the FST accepts nothing
+            states = []
+        for s1 in states:  # the list grows as we find new states
+            if record is not None:
+                record.expand(len(states) - number[s1])
+            if self.is_accepting(s1):
+                result.mark_accepting(number[s1])
+            for insym, outsym, s2, w in self.arcs(s1):
+                if s2 not in coaccessible:
+                    continue
+                if s2 not in number:
+                    number[s2] = len(states)
+                    states.append(s2)
+                result.add_transition(number[s1], insym, number[s2], outsym, w)
+        result = self._end_pass(record, result)
+        if report is not None:
+            report.append({"pass": "connect", "before": self.stats(), "after": result.stats()})
+        return result
+
+    trim = connect
+
+    def rmepsilon(self):
+        """Return an equivalent FST without arcs of empty input.
+
+        Each state q gets the arcs of the states p it reaches by
+        epsilon-input arcs, with the outputs and weights of the epsilon
+        path prepended, so the output labels may become strings of
+        more than one symbol. If such a p is accepting, q is accepting
+        when the epsilon path had no output and zero weight; otherwise
+        q gets an epsilon arc with that output and weight to a new
+        accepting state without outgoing arcs. These final arcs are the
+        only epsilon arcs left, and a search follows them only at the
+        end of the input. Only the states reachable from the start
+        state are kept. The FST should not have epsilon loops.
+        """
+        record = instrument.begin("rmepsilon")
+        result = FST()
+        result.start_state = self.start_state
+        result._states.add(self.start_state)
+        final_arcs = []  # (state, output, weight)
+        agenda = [self.start_state]
+        visited = set(agenda)
+        while agenda:
+            q = agenda.pop()
+            if record is not None:
+                record.expand(len(agenda) + 1)
+            # the epsilon closure of q as (state, output, weight, depth)
+            closure = [(q, "", 0, 0)]
+            for p, out, w, depth in closure:  # the list grows as we go
+                if depth > len(self._states):
+                    raise ValueError("rmepsilon() does not support epsilon loops")
+                for p2, outsym, w2 in self.get_transitions(p, ""):
+                    closure.append((p2, out + outsym, w + w2, depth + 1))
+            for p, out, w, _ in closure:
+                if self.is_accepting(p):
+                    if out == "" and w == 0:
+                        result.mark_accepting(q)
+                    else:
+                        final_arcs.append((q, out, w))
+                for insym, targets in self._arcs.get(p, {}).items():
+                    for outsym, s2, w2 in targets:
+                        result.add_transition(q, insym, s2, out + outsym, w + w2)
+                        if s2 not in visited:
+                            visited.add(s2)
+                            agenda.append(s2)
+        final = None
+        for q, out, w in final_arcs:
+            final = result.add_transition(q, "", final, out, w)
+            result.mark_accepting(final)
+        return self._end_pass(record, result)
+
+    def determinize(self, max_states=None):
+        """Return an FST with at most one arc per (insym, outsym) label
+        leaving each state.
+
+        The FST is determinized as a weighted acceptor over the
+        input:output pairs in the (max, +) semiring, so of the paths
+        with the same label sequence only the best one is kept. The
+        results of transduce_nbest() and transduce_lattice() (with
+        combine=max) do not change. A spell FST maps an input to many
+        outputs, so it cannot be made deterministic on the input alone.
+
+        The states of the result are subsets of states with their
+        residual weights, numbered from 0 (the start state). A subset
+        whose best accepting state has a residual weight below zero
+        gets an epsilon arc with that weight to a new accepting state,
+        as we have no final weights. Determinization terminates for
+        acyclic FSTs, such as the composition with a lexicon, but not
+        for every FST: a ValueError is raised when the result would
+        have more than 'max_states' states (None for no limit).
+        """
+        record = instrument.begin("determinize")
+        det = FST()
+        det.start_state = 0
+        start = frozenset([(self.start_state, 0)])
+        number = {start: 0}
+        agenda = [start]
+        final_arcs = []  # (state, weight)
+        while agenda:
+            subset = agenda.pop()
+            if record is not None:
+                record.expand(len(agenda) + 1)
+            s1 = number[subset]
+            finals = [v for q, v in subset if self.is_accepting(q)]
+            if finals:
+                if max(finals) == 0:
+                    det.mark_accepting(s1)
+                else:
+                    final_arcs.append((s1, max(finals)))
+            by_label = dict()  # (insym, outsym) -> {state: best weight}
+            for q, v in subset:
+                for insym, outsym, s2, w in self.arcs(q):
+                    targets = by_label.setdefault((insym, outsym), {})
+                    if s2 not in targets or v + w > targets[s2]:
+                        targets[s2] = v + w
+            for (insym, outsym), targets in by_label.items():
+                w = max(targets.values())
+                # rounded, so that equal subsets are found again
+                next_subset = frozenset((s2, round(v - w, 12)) for s2, v in targets.items())
+                if next_subset not in number:
+                    if max_states is not None and len(number) >= max_states:
+                        raise ValueError("determinize() would need more than {} states"
+                                         .format(max_states))
+                    number[next_subset] = len(number)
+                    agenda.append(next_subset)
+                det.add_transition(s1, insym, number[next_subset], outsym, w)
+        final = len(number)
+        for s1, w in final_arcs:
+            det.add_transition(s1, "", final, "", w, accepting=True)
+        return self._end_pass(record, det)
+
+    def push_weights(self):
+        """Return an equivalent FST with the weights pushed towards
+        the start state.
+
+        The potential d(q) of a state is the weight of the best path
+        from q to an accepting state. Each arc q -> r gets the weight
+        w + d(r) - d(q), and the arcs leaving the start state d(start)
+        in addition, so every complete path keeps its weight. The
+        weight of a partial path is then the best weight of any of its
+        completions, and transduce_nbest() (or a 'max_cost') prunes
+        bad paths as soon as they go wrong rather than at the end.
+        States that cannot reach an accepting state are dropped.
+
+        As for transduce_nbest(), the weights should be log
+        probabilities (never positive), otherwise a ValueError is
+        raised. If the start state has incoming arcs, a new start state
+        is added.
+        """
+        record = instrument.begin("push_weights")
+        reverse = dict()  # s2 -> [(s1, w)]
+        for (s1, insym), targets in self.transitions.items():
+            for outsym, s2, w in targets:
+                if w > 0:
+                    raise ValueError("push_weights() requires weights that are never positive")
+                reverse.setdefault(s2, []).append((s1, w))
+        # Dijkstra from the accepting states over the reversed arcs,
+        # on the costs -w
+        potential = dict()
+        counter = 0
+        agenda = []
+        for q in self.accepting:
+            counter += 1
+            agenda.append((0, counter, q))
+        while agenda:
+            cost, _, q = heapq.heappop(agenda)
+            if q in potential:
+                continue
+            if record is not None:
+                record.expand(len(agenda) + 1)
+            potential[q] = -cost
+            for s1, w in reverse.get(q, ()):
+                if s1 not in potential:
+                    counter += 1
+                    heapq.heappush(agenda, (cost - w, counter, s1))
+
+        start = self.start_state
+        pushed = FST()
+        pushed.start_state = start
+        pushed._states.add(start)
+        pushed.accepting = set(self.accepting)
+        if start not in potential:  # the FST accepts nothing
+            return self._end_pass(record, pushed)
+        # the weight of the best path is put on the first arc
+        initial = potential[start] if start not in reverse else 0
+        for (s1, insym), targets in self.transitions.items():
+            if s1 not in potential:
+                continue
+            for outsym, s2, w in targets:
+                if s2 in potential:
+                    w = min(0, w + potential[s2] - potential[s1])
+                    if s1 == start:
+                        w += initial
+                    pushed.add_transition(s1, insym, s2, outsym, w)
+        if start in reverse and potential[start] != 0:
+            new_start = len(pushed._states)
+            while new_start in pushed._states: new_start += 1
+            pushed._states.add(new_start)
+            for insym, outsym, s2, w in list(pushed.arcs(start)):
+                pushed.add_transition(new_start, insym, s2, outsym, w + potential[start])
+            pushed.start_state = new_start
+        return self._end_pass(record, pushed)
+
+    def optimize(self, passes=OPTIMIZE_PASSES, report=None):
+        """Run the optimization passes on the FST and return the result.
+
+        'passes' are the names of the methods to apply in order, by
+        default connect(), rmepsilon(), determinize() and
+        push_weights(). If
+        'report' is a list, a dictionary {"pass": name, "before":
+        stats(), "after": stats()} is appended to it for each pass.
+        """
+        fst = self
+        for name in passes:
+            before = fst.stats() if report is not None else None
+            fst = getattr(fst, name)()
+            if report is not None:
+                report.append({"pass": name, "before": before, "after": fst.stats()})
+        return fst
+
+    def freeze(self):
+        """Return an immutable, array-backed copy of the FST.
+
+        See FrozenFST. Only the states reachable from the start state
+        are kept, and they are renumbered from 0.
+        """
+        by_state = dict()
+        for (s1, insym), s2_total in self.transitions.items():
+            for outsym, s2, w in s2_total:
+                by_state.setdefault(s1, []).append((insym, outsym, s2, w))
+        return FrozenFST.build(self.start_state,
+                               lambda s1: by_state.get(s1, ()),
+                               self.is_accepting)
+
+    def save(self, filename):
+        """Write the FST to 'filename' in the binary format of FrozenFST.
+        """
+        self.freeze().save(filename)
+
+    @staticmethod
+    def load(filename, verify=True):
+        """Load an FST written by save(), see FrozenFST.load().
+
+        The result is a (read-only) FrozenFST.
+        """
+        return FrozenFST.load(filename, verify=verify)
+
+
+class FrozenFST:
+    """An immutable weighted FST stored in flat arrays.
+
+    States are integers from 0 to num_states - 1, 0 being the start
+    state. Symbols are interned: `symbols` is the symbol table, and
+    the id of the empty string (epsilon) is always 0. The arcs leaving
+    state q are found at the positions offsets[q]:offsets[q + 1] of
+    the parallel arrays insyms, outsyms, targets and weights, sorted
+    by input symbol (so epsilon arcs come first). `final` has a
+    non-zero byte for each accepting state.
+
+    The methods used for searching (get_transitions, arcs,
+    is_accepting, transduce) behave as the ones of FST, and the
+    symbols passed to and returned from them are strings as well.
+    """
+
+    version = 0  # never modified
+    state_dtype = np.int32
+    symbol_dtype = np.int32
+    offset_dtype = np.int64
+    weight_dtype = np.float64
+
+    def __init__(self, symbols, offsets, insyms, outsyms, targets, weights, final):
+        self.symbols = tuple(symbols)
+        self._symbol_ids = {sym: i for i, sym in enumerate(self.symbols)}
+        self.offsets = offsets
+        self.insyms = insyms
+        self.outsyms = outsyms
+        self.targets = targets
+        self.weights = weights
+        self.final = final
+        for a in (offsets, insyms, outsyms, targets, weights, final):
+            a.flags.writeable = False
+        # indexing a memoryview gives plain Python numbers, which is
+        # much faster than indexing the arrays one item at a time
+        self._offsets = memoryview(offsets)
+        self._insyms = memoryview(insyms)
+        self._outsyms = memoryview(outsyms)
+        self._targets = memoryview(targets)
+        self._weights = memoryview(weights)
+        self._final = memoryview(final)
+        self.start_state = 0
+
+    @classmethod
+    def build(cls, start, arcs_of, is_accepting, stage="freeze"):
+        """Build a FrozenFST by breadth-first search from 'start'.
+
+        'arcs_of(q)' should return the transitions leaving the state q
+        as (insym, outsym, q2, w) tuples, and 'is_accepting(q)' tell if
+        q is accepting. The states can be any hashable labels, they are
+        numbered in the order we reach them. 'stage' is the name the
+        build is counted under by the instrument module.
+        """
+        record = instrument.begin(stage)
+        if record is not None:
+            arcs_of = record.counting(arcs_of)
+        symbols = [""]
+        symbol_ids = {"": 0}
+        number = {start: 0}
+        states = [start]
+        offsets = array('q', [0])
+        insyms, outsyms, targets = array('i'), array('i'), array('i')
+        weights = array('d')
+        final = bytearray()
+        for i, s1 in enumerate(states):  # the list grows as we find new states
+            if record is not None:
+                record.expand(len(states) - i)
+            final.append(1 if is_accepting(s1) else 0)
+            state_arcs = set()
+            for insym, outsym, s2, w in arcs_of(s1):
+                for sym in (insym, outsym):
+                    if sym not in symbol_ids:
+                        symbol_ids[sym] = len(symbols)
+                        symbols.append(sym)
+                if s2 not in number:
+                    number[s2] = len(states)
+                    states.append(s2)
+                state_arcs.add((symbol_ids[insym], symbol_ids[outsym],
+                                number[s2], float(w)))
+            for insym, outsym, s2, w in sorted(state_arcs):
+                insyms.append(insym)
+                outsyms.append(outsym)
+                targets.append(s2)
+                weights.append(w)
+            offsets.append(len(targets))
+        if record is not None:
+            record.extra["states"] = len(states)
+            record.extra["arcs"] = len(targets)
+            instrument.end(record)
+        return cls(symbols,
+                   np.frombuffer(offsets, dtype=cls.offset_dtype),
+                   np.frombuffer(insyms, dtype=cls.symbol_dtype),
+                   np.frombuffer(outsyms, dtype=cls.symbol_dtype),
+                   np.frombuffer(targets, dtype=cls.state_dtype),
+                   np.frombuffer(weights, dtype=cls.weight_dtype),
+                   np.frombuffer(final, dtype=np.uint8))
+
+    @classmethod
+    def compose(cls, m1, m2):
+        """Compose m1 and m2 directly into a FrozenFST.
+
+        Same as FST.compose_fst(), but the product is never stored as
+        an FST, so the memory needed is about the size of the result.
+        m1 and m2 can be any FSTs supported by LazyComposeFST.
+        """
+        lazy = LazyComposeFST(m1, m2, cache_size=0)
+        return cls.build(lazy.start_state, lazy.arcs, lazy.is_accepting,
+                         stage="compose")
+
+    @property
+    def num_states(self):
+        return len(self.offsets) - 1
+
+    @property
+    def num_arcs(self):
+        return len(self.targets)
+
+    @property
+    def accepting(self):
+        return frozenset(np.flatnonzero(self.final).tolist())
+
+    @property
+    def nbytes(self):
+        """ Size of the arrays in bytes (the symbol table is not included).
+        """
+        return sum(a.nbytes for a in (self.offsets, self.insyms, self.outsyms,
+                                      self.targets, self.weights, self.final))
+
+    def stats(self):
+        """ Return the number of states, arcs and symbols, and the
+        memory used by the arrays in bytes. See FST.stats().
+        """
+        return {"states": self.num_states,
+                "arcs": self.num_arcs,
+                "accepting": int(np.count_nonzero(self.final)),
+                "input_symbols": len(np.unique(self.insyms)),
+                "output_symbols": len(np.unique(self.outsyms)),
+                "bytes": self.nbytes}
+
+    def is_accepting(self, state):
+        return self._final[state] != 0
+
+    def _arc_range(self, s1, insym=None):
+        lo, hi = self._offsets[s1], self._offsets[s1 + 1]
+        if insym is not None:
+            sym = self._symbol_ids.get(insym)
+            if sym is None:
+                return lo, lo
+            lo = bisect_left(self._insyms, sym, lo, hi)
+            hi = bisect_right(self._insyms, sym, lo, hi)
+        return lo, hi
+
+    def arcs(self, s1):
+        """ Yield all transitions leaving s1 as (insym, outsym, s2, w).
+        """
+        lo, hi = self._arc_range(s1)
+        symbols = self.symbols
+        for i in range(lo, hi):
+            yield (symbols[self._insyms[i]], symbols[self._outsyms[i]],
+                   self._targets[i], self._weights[i])
+
+    def get_transitions(self, s1, insym=None):
+        """ Yield (s2, outsym, w) for the transitions leaving s1,
+        only those with input 'insym' if it is given.
+        """
+        lo, hi = self._arc_range(s1, insym)
+        symbols = self.symbols
+        for i in range(lo, hi):
+            yield self._targets[i], symbols[self._outsyms[i]], self._weights[i]
+
+    def move(self, s1, insym):
+        """ Return the set of (outsym, s2, w) reachable from 's1' on 'insym'
+        """
+        return {(outsym, s2, w) for s2, outsym, w in self.get_transitions(s1, insym)}
+
+    # the searches only use the methods above, so they are shared with FST
+    transduce = FST.transduce
+    transduce_iter = FST.transduce_iter
+    transduce_lattice = FST.transduce_lattice
+    transduce_nbest = FST.transduce_nbest
+
+    _file_arrays = (("offsets", "<i8"), ("insyms", "<i4"), ("outsyms", "<i4"),
+                    ("targets", "<i4"), ("weights", "<f8"), ("final", "u1"))
+
+    def save(self, filename):
+        """Write the FST to 'filename' as a flat binary file.
+
+        The file starts with FILE_MAGIC, the format version and the
+        length of a JSON header (as two little-endian uint32), followed
+        by the header and the arrays, each aligned to 8 bytes. The
+        header holds the symbol table, the position and length of each
+        array and a CRC-32 checksum of everything after the header.
+        """
+        arrays, layout, pos = [], {}, 0
+        for name, dtype in self._file_arrays:
+            a = np.ascontiguousarray(getattr(self, name), dtype=dtype)
+            layout[name] = (pos, len(a))
+            arrays.append(a)
+            pos += -(-a.nbytes // 8) * 8
+        checksum = 0
+        for a in arrays:
+            checksum = zlib.crc32(a.tobytes(), checksum)
+            checksum = zlib.crc32(bytes(-a.nbytes % 8), checksum)
+        header = json.dumps({"symbols": self.symbols, "arrays": layout,
+                             "checksum": checksum}).encode("utf-8")
+        header += b" " * (-(len(FILE_MAGIC) + 8 + len(header)) % 8)
+        with open(filename, "wb") as f:
+            f.write(FILE_MAGIC)
+            f.write(struct.pack("<II", FILE_VERSION, len(header)))
+            f.write(header)
+            for a in arrays:
+                f.write(a.tobytes())
+                f.write(bytes(-a.nbytes % 8))
+
+    @classmethod
+    def load(cls, filename, verify=True):
+        """Load an FST written by save() by memory-mapping the file.
+
+        The arrays are read-only views of the mapped file, so loading
+        takes about the same time regardless of the size of the FST,
+        and processes that load the same file share its pages. If
+        'verify' is True the checksum is checked (this reads the whole
+        file once). A ValueError is raised for files that are not in
+        the expected format.
+        """
+        with open(filename, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        start = len(FILE_MAGIC) + 8
+        if mm[:len(FILE_MAGIC)] != FILE_MAGIC:
+            raise ValueError("{}: not a saved FST".format(filename))
+        version, header_len = struct.unpack("<II", mm[len(FILE_MAGIC):start])
+        if version != FILE_VERSION:
+            raise ValueError("{}: unsupported file version {}".format(filename, version))
+        header = json.loads(mm[start:start + header_len].decode("utf-8"))
+        data = start + header_len
+        if verify and zlib.crc32(memoryview(mm)[data:]) != header["checksum"]:
+            raise ValueError("{}: checksum mismatch".format(filename))
+        arrays = {}
+        for name, dtype in cls._file_arrays:
+            pos, count = header["arrays"][name]
+            a = np.frombuffer(mm, dtype=dtype, count=count, offset=data + pos)
+            if sys.byteorder != "little":
+                a = a.astype(a.dtype.newbyteorder("="))
+            arrays[name] = a
+        fst = cls(header["symbols"], **arrays)
+        fst._mmap = mm
+        return fst
+
+    def invert(self):
+        """Return a new FrozenFST with input and output labels swapped.
+        """
+        record = instrument.begin("invert")
+        order = np.lexsort((self.targets, self.insyms, self.outsyms,
+                            np.repeat(np.arange(self.num_states),
+                                      np.diff(self.offsets))))
+        inverted = FrozenFST(self.symbols, self.offsets.copy(),
+                             self.outsyms[order], self.insyms[order],
+                             self.targets[order], self.weights[order],
+                             self.final.copy())
+        if record is not None:
+            record.extra["arcs"] = self.num_arcs
+            instrument.end(record)
+        return inverted
+
+    def connect(self, report=None):
+        """Return a new FrozenFST without the states that are not
+        reachable from the start state or cannot reach an accepting
+        state. See FST.connect().
+        """
+        n = self.num_states
+        sources = np.repeat(np.arange(n), np.diff(self.offsets))
+        # the arcs sorted by target, to follow them backwards
+        order = np.argsort(self.targets, kind="stable")
+        rev_offsets = np.searchsorted(self.targets[order], np.arange(n + 1)).tolist()
+        rev_sources = sources[order].tolist()
+        coaccessible = self.final.astype(bool)
+        agenda = np.flatnonzero(coaccessible).tolist()
+        while agenda:
+            s2 = agenda.pop()
+            for s1 in rev_sources[rev_offsets[s2]:rev_offsets[s2 + 1]]:
+                if not coaccessible[s1]:
+                    coaccessible[s1] = True
+                    agenda.append(s1)
+        coaccessible = coaccessible.tolist()
+
+        def arcs_of(s1):
+            if not coaccessible[s1]:
+                return ()
+            return (arc for arc in self.arcs(s1) if coaccessible[arc[2]])
+        result = FrozenFST.build(0, arcs_of, self.is_accepting, stage="connect")
+        if report is not None:
+            report.append({"pass": "connect", "before": self.stats(), "after": result.stats()})
+        return result
+
+    trim = connect
+
+
+class LazyComposeFST:
+    """The composition of two FSTs, computed on demand.
+
+    The states are the pairs (q1, q2) of states of m1 and m2, and the
+    transitions of a state are only computed when a search reaches it,
+    so creating the object costs nothing, and a query only pays for
+    the states it visits. m1 and m2 can be FST, FrozenFST or
+    LazyComposeFST instances (anything with start_state, arcs(),
+    get_transitions() and is_accepting()), and they are not copied.
+
+    Unlike compose_fst(), epsilons are allowed on both sides: an arc
+    of m1 with empty output moves in m1 only, and an arc of m2 with
+    empty input moves in m2 only.
+
+    The transitions of the expanded states are kept in an LRU cache of
+    at most 'cache_size' states (None for no limit, 0 for no cache).
+    With the spell FST of lexicon.txt a state takes about 5 KB and a
+    query expands up to a few hundred, so the default keeps the
+    states of many recent queries in about 50 MB, however long the
+    object lives.
+
+    For spelling correction we want the inverse of lexicon o edits,
+    which is LazyComposeFST(inverted edits, lexicon) as the lexicon
+    is an identity transducer. Changing the edit model only needs a
+    new LazyComposeFST, there is nothing to recompose.
+    """
+
+    def __init__(self, m1, m2, cache_size=10000):
+        self.m1 = m1
+        self.m2 = m2
+        self.start_state = (m1.start_state, m2.start_state)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # state -> {insym: [(s2, outsym, w)]}
+
+    @property
+    def version(self):
+        """ Changes when m1 or m2 is replaced or modified.
+        """
+        return (id(self.m1), getattr(self.m1, "version", None),
+                id(self.m2), getattr(self.m2, "version", None))
+
+    def is_accepting(self, state):
+        return self.m1.is_accepting(state[0]) and self.m2.is_accepting(state[1])
+
+    def _compose_arcs(self, q1, q2, m1_arcs, with_epsilon):
+        """ Yield (insym, outsym, s2, w) from the arcs of m1 leaving q1
+        (given as (insym, outsym, s1, w1) tuples).
+        """
+        m2 = self.m2
+        for insym, outsym1, s1, w1 in m1_arcs:
+            if outsym1 == "":
+                yield insym, "", (s1, q2), w1
+            else:
+                for s2, outsym2, w2 in m2.get_transitions(q2, outsym1):
+                    yield insym, outsym2, (s1, s2), w1 + w2
+        if with_epsilon:
+            for s2, outsym2, w2 in m2.get_transitions(q2, ""):
+                yield "", outsym2, (q1, s2), w2
+
+    def _expand(self, state):
+        """ Return the transitions of state grouped by input symbol.
+        """
+        grouped = self._cache.get(state)
+        if grouped is not None:
+            self._cache.move_to_end(state)
+            return grouped
+        grouped = dict()
+        q1, q2 = state
+        for insym, outsym, s2, w in self._compose_arcs(q1, q2, self.m1.arcs(q1), True):
+            grouped.setdefault(insym, []).append((s2, outsym, w))
+        self._cache[state] = grouped
+        if self.cache_size is not None and len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return grouped
+
+    def clear_cache(self, m1_states=None, m2_states=None):
+        """ Forget the cached transitions, only those of the states
+        (q1, q2) with q1 in 'm1_states' or q2 in 'm2_states' if either
+        is given (e.g., the states of m2 that were changed).
+        """
+        if m1_states is None and m2_states is None:
+            self._cache.clear()
+            return
+        m1_states = m1_states or ()
+        m2_states = m2_states or ()
+        for state in [state for state in self._cache
+                      if state[0] in m1_states or state[1] in m2_states]:
+            del self._cache[state]
+
+    def stats(self):
+        """ Return the statistics of m1 and m2 and the number of cached
+        states. The composition itself is never built, so the number
+        of its states is not known.
+        """
+        cache_bytes = sys.getsizeof(self._cache)
+        for state, grouped in self._cache.items():
+            cache_bytes += sys.getsizeof(state) + instrument.sizeof_transitions(grouped)
+        return {"m1": self.m1.stats(), "m2": self.m2.stats(),
+                "cached_states": len(self._cache), "cache_bytes": cache_bytes}
+
+    def arcs(self, s1):
+        """ Yield all transitions leaving s1 as (insym, outsym, s2, w).
+        """
+        if self.cache_size == 0:
+            q1, q2 = s1
+            yield from self._compose_arcs(q1, q2, self.m1.arcs(q1), True)
+        else:
+            for insym, targets in self._expand(s1).items():
+                for s2, outsym, w in targets:
+                    yield insym, outsym, s2, w
+
+    def get_transitions(self, s1, insym=None):
+        """ Yield (s2, outsym, w) for the transitions leaving s1,
+        only those with input 'insym' if it is given.
+        """
+        if insym is None:
+            for _, outsym, s2, w in self.arcs(s1):
+                yield s2, outsym, w
+        elif self.cache_size == 0:
+            q1, q2 = s1
+            m1_arcs = ((insym, outsym, s, w)
+                       for s, outsym, w in self.m1.get_transitions(q1, insym))
+            for _, outsym, s2, w in self._compose_arcs(q1, q2, m1_arcs, insym == ""):
+                yield s2, outsym, w
+        else:
+            yield from self._expand(s1).get(insym, ())
+
+    def move(self, s1, insym):
+        """ Return the set of (outsym, s2, w) reachable from 's1' on 'insym'
+        """
+        return {(outsym, s2, w) for s2, outsym, w in self.get_transitions(s1, insym)}
+
+    transduce = FST.transduce
+    transduce_iter = FST.transduce_iter
+    transduce_lattice = FST.transduce_lattice
+    transduce_nbest = FST.transduce_nbest
+
 
 if __name__ == "__main__":
     cat = FST()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Data Structures and Algorithms for CL 3, Project 1
+See <https://https://dsacl3-2022.github.io/p1/> for detailed instructions.
+Author:      Pun Ching Nei, Lorena Raichle, Kateryna Smykovska
+Honor Code:  I pledge that this program represents my work.
+We received help from: no one in designing and debugging our program.
+"""
+
+import sys
+import time
+from contextlib import contextmanager
+
+
+class Record:
+    """ Counters of one run of a stage (a search, a composition ...).
+
+    Attributes:
+        stage: name of the stage
+        time_s: wall time, set when the stage ends
+        states_expanded: states (or search nodes) whose arcs were read
+        arcs_scanned: arcs read
+        epsilon_arcs: arcs with empty input followed
+        agenda_peak: largest size of the agenda (stack, queue, heap)
+        extra: other counters specific to the stage
+    """
+
+    __slots__ = ("stage", "start", "time_s", "states_expanded", "arcs_scanned",
+                 "epsilon_arcs", "agenda_peak", "extra")
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.start = time.perf_counter()
+        self.time_s = 0.0
+        self.states_expanded = 0
+        self.arcs_scanned = 0
+        self.epsilon_arcs = 0
+        self.agenda_peak = 0
+        self.extra = dict()
+
+    def expand(self, agenda_size=0):
+        """ Count an expanded state, with the current agenda size.
+        """
+        self.states_expanded += 1
+        if agenda_size > self.agenda_peak:
+            self.agenda_peak = agenda_size
+
+    def counting(self, get_transitions):
+        """ Wrap a get_transitions() (or arcs()) method to count the
+        arcs it yields.
+        """
+        def counted(s1, *insym):
+            for transition in get_transitions(s1, *insym):
+                self.arcs_scanned += 1
+                if insym == ("",):
+                    self.epsilon_arcs += 1
+                yield transition
+        return counted
+
+    def as_dict(self):
+        d = {"time_s": self.time_s, "states_expanded": self.states_expanded,
+             "arcs_scanned": self.arcs_scanned, "epsilon_arcs": self.epsilon_arcs,
+             "agenda_peak": self.agenda_peak}
+        d.update(self.extra)
+        return d
+
+
+class Stats:
+    """ Totals of the records of each stage, collected by collect().
+
+    Attributes:
+        stages: stage name -> dictionary of summed counters ("calls"
+            is the number of runs, "agenda_peak" the maximum)
+        callback: if given, called as callback(record) when a stage ends
+    """
+
+    def __init__(self, callback=None):
+        self.stages = dict()
+        self.callback = callback
+
+    def add(self, record):
+        total = self.stages.setdefault(record.stage, {"calls": 0})
+        total["calls"] += 1
+        for name, value in record.as_dict().items():
+            if name == "agenda_peak":
+                total[name] = max(total.get(name, 0), value)
+            else:
+                total[name] = total.get(name, 0) + value
+        if self.callback is not None:
+            self.callback(record)
+
+    def report(self, file=sys.stdout):
+        for stage, total in self.stages.items():
+            print(stage + ": " + ", ".join("{}={:.4g}".format(k, v) if isinstance(v, float)
+                                           else "{}={}".format(k, v)
+                                           for k, v in total.items()), file=file)
+
+
+_active = None  # the Stats being collected, if any
+
+
+def begin(stage):
+    """ Return a new Record for stage, or None when we do not collect.
+
+    Instrumented code calls this once when a stage starts and only
+    counts anything if the result is not None, so the instrumentation
+    costs a function call per stage when it is disabled.
+    """
+    if _active is None:
+        return None
+    return Record(stage)
+
+
+def end(record):
+    """ Finish a record returned by begin() and add it to the totals.
+    """
+    record.time_s = time.perf_counter() - record.start
+    if _active is not None:
+        _active.add(record)
+
+
+@contextmanager
+def collect(callback=None):
+    """ Collect the counters of the instrumented stages run in the block.
+
+        with instrument.collect() as stats:
+            spellfst.transduce("wort")
+        print(stats.stages["transduce"])
+    """
+    global _active
+    previous = _active
+    _active = Stats(callback)
+    try:
+        yield _active
+    finally:
+        _active = previous
+
+
+def sizeof_transitions(transitions):
+    """ Estimate the bytes used by a dictionary of transitions whose
+    values are sets of states or of tuples (symbols are not counted,
+    as they are shared).
+    """
+    size = sys.getsizeof(transitions)
+    for key, targets in transitions.items():
+        size += sys.getsizeof(key) + sys.getsizeof(targets)
+        for target in targets:
+            size += sys.getsizeof(target)
+    return size
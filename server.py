@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Data Structures and Algorithms for CL 3, Project 1
+See <https://https://dsacl3-2022.github.io/p1/> for detailed instructions.
+Author:      Pun Ching Nei, Lorena Raichle, Kateryna Smykovska
+Honor Code:  I pledge that this program represents my work.
+We received help from: no one in designing and debugging our program.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import spellcheck
+
+
+def _correct_queries(queries):
+    """ Correct a batch of (word, n, max_cost) queries in a worker.
+
+    A query that fails gets its exception in place of its result, so
+    that it does not fail the other queries of the batch.
+    """
+    results = []
+    for word, n, max_cost in queries:
+        try:
+            results.append(spellcheck._worker_fst.transduce_nbest(word, n, max_cost))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+class SpellServer:
+    """A spell checking server speaking a line-based JSON protocol.
+
+    Each request is a line with either a bare word or a JSON object
+    {"id": ..., "word": ..., "n": ..., "max_cost": ...} (all but
+    "word" optional), and gets a line
+    {"id": ..., "word": ..., "corrections": [[word, weight], ...],
+     "latency_ms": ...} in the same order as the requests of the
+    connection. The line {"stats": true} is answered with
+    {"stats": stats()}, and invalid lines with {"error": ...}.
+
+    Requests arriving within 'batch_window' seconds of each other
+    are corrected together (at most 'max_batch' at once) by a pool of
+    'processes' worker processes, with at most one batch per worker in
+    flight. The worker processes share the FST as in
+    spellcheck.correct_batch(): they memory-map 'filename' if it is
+    given, otherwise they inherit 'spellfst' by forking.
+
+    Backpressure: at most 'max_pending' requests wait for a batch and
+    at most 'max_inflight' per connection wait for their answer; past
+    these limits we stop reading from the connection until there is
+    room again.
+    """
+
+    def __init__(self, spellfst=None, filename=None, processes=None, n=5,
+                 batch_window=0.002, max_batch=64, max_pending=1024,
+                 max_inflight=256, latency_window=10000):
+        if filename is not None:
+            context = multiprocessing.get_context()
+        elif spellfst is not None:
+            spellcheck._worker_fst = spellfst
+            context = multiprocessing.get_context("fork")
+        else:
+            raise ValueError("either spellfst or filename is required")
+        self.processes = processes or multiprocessing.cpu_count()
+        self._pool = ProcessPoolExecutor(self.processes, mp_context=context,
+                                         initializer=spellcheck._init_worker,
+                                         initargs=(filename,))
+        # start the workers now: forked later, they would inherit the
+        # sockets of open connections and keep them from being closed
+        self._pool.submit(int).result()
+        self.n = n
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.max_inflight = max_inflight
+        self.latencies = deque(maxlen=latency_window)  # in seconds
+        self.requests = 0
+        self.batches = 0
+        self._queue = None
+        self._batcher = None
+        self._tasks = set()  # the running _run_batch() tasks
+
+    def stats(self):
+        """Return request and batch counts and latency percentiles (ms)
+        over the last 'latency_window' requests.
+        """
+        stats = {"requests": self.requests, "batches": self.batches,
+                 "pending": self._queue.qsize() if self._queue else 0}
+        if self.latencies:
+            p50, p95, p99 = np.percentile(np.array(self.latencies) * 1000, [50, 95, 99])
+            stats.update(p50_ms=p50, p95_ms=p95, p99_ms=p99)
+        return stats
+
+    async def _run_batch(self, batch, slots):
+        loop = asyncio.get_running_loop()
+        try:
+            queries = [query for query, _, _ in batch]
+            try:
+                results = await loop.run_in_executor(self._pool, _correct_queries, queries)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            now = loop.time()
+            for (_, future, received), result in zip(batch, results):
+                self.latencies.append(now - received)
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        finally:
+            slots.release()
+
+    async def _batch_requests(self):
+        """ Collect requests into micro-batches and send them to the pool.
+        """
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.processes)
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await slots.acquire()
+            self.batches += 1
+            # keep a reference, or the task may be collected mid-flight
+            task = asyncio.ensure_future(self._run_batch(batch, slots))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _parse(self, line):
+        """ Return (request id, word, n, max_cost) or None for a stats request.
+        """
+        line = line.strip()
+        if not line.startswith("{"):
+            return None, line, self.n, None
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("a request must be a JSON object")
+        if request.get("stats"):
+            return None
+        word = request["word"]
+        n = request.get("n", self.n)
+        max_cost = request.get("max_cost")
+        if not isinstance(word, str):
+            raise ValueError("'word' must be a string")
+        if not isinstance(n, int) or isinstance(n, bool) or n < 1:
+            raise ValueError("'n' must be a positive integer")
+        if max_cost is not None and (not isinstance(max_cost, (int, float))
+                                     or isinstance(max_cost, bool)):
+            raise ValueError("'max_cost' must be a number or null")
+        return request.get("id"), word, n, max_cost
+
+    async def _handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        answers = asyncio.Queue(self.max_inflight)  # in request order
+
+        async def write_answers():
+            while True:
+                answer = await answers.get()
+                if answer is None:
+                    break
+                if isinstance(answer, dict):  # already answered
+                    response = answer
+                else:
+                    request_id, word, received, future = answer
+                    try:
+                        response = {"id": request_id, "word": word,
+                                    "corrections": await future,
+                                    "latency_ms": (loop.time() - received) * 1000}
+                    except Exception as e:
+                        response = {"id": request_id, "word": word, "error": str(e)}
+                writer.write((json.dumps(response, ensure_ascii=False) + "\n").encode())
+                await writer.drain()
+
+        async def skip_line():
+            """ Drop the rest of a line over the limit of the reader. """
+            while True:
+                try:
+                    await reader.readuntil(b"\n")
+                    return
+                except asyncio.LimitOverrunError as e:
+                    await reader.readexactly(e.consumed)
+
+        async def read_requests():
+            while True:
+                try:
+                    line = await reader.readuntil(b"\n")
+                except asyncio.IncompleteReadError as e:
+                    line = e.partial  # the last line has no newline
+                    if not line:
+                        break
+                except asyncio.LimitOverrunError:
+                    await answers.put({"error": "bad request: line too long"})
+                    try:
+                        await skip_line()
+                    except asyncio.IncompleteReadError:
+                        break
+                    continue
+                received = loop.time()
+                try:
+                    request = self._parse(line.decode())
+                except (ValueError, KeyError) as e:
+                    await answers.put({"error": "bad request: {}".format(e)})
+                    continue
+                if request is None:
+                    await answers.put({"stats": self.stats()})
+                    continue
+                request_id, word, n, max_cost = request
+                self.requests += 1
+                future = loop.create_future()
+                await answers.put((request_id, word, received, future))
+                await self._queue.put(((word, n, max_cost), future, received))
+
+        writer_task = asyncio.ensure_future(write_answers())
+        reader_task = asyncio.ensure_future(read_requests())
+
+        def writer_failed():
+            return (writer_task.done() and not writer_task.cancelled()
+                    and writer_task.exception() is not None)
+
+        def writer_done(task):
+            # e.g. the client went away: stop reading, or we would
+            # block on a full 'answers' queue forever
+            if writer_failed():
+                reader_task.cancel()
+        writer_task.add_done_callback(writer_done)
+        try:
+            try:
+                await reader_task
+            except asyncio.CancelledError:
+                if not writer_failed():
+                    raise
+            except Exception:
+                pass  # e.g. the connection was reset: answer what we read
+            # the answers already queued are still written
+            if not writer_task.done():
+                await answers.put(None)
+            try:
+                await writer_task
+            except Exception:
+                pass  # the connection is gone, there is nobody to answer
+        finally:
+            reader_task.cancel()
+            writer_task.cancel()
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=8765, unix=None):
+        """Start listening on a TCP port, or on a Unix socket if 'unix'
+        is a path, and return the asyncio server.
+        """
+        self._queue = asyncio.Queue(self.max_pending)
+        self._batcher = asyncio.ensure_future(self._batch_requests())
+        if unix is not None:
+            return await asyncio.start_unix_server(self._handle, path=unix)
+        return await asyncio.start_server(self._handle, host, port)
+
+    def close(self):
+        if self._batcher is not None:
+            self._batcher.cancel()
+        for task in self._tasks:
+            task.cancel()
+        self._pool.shutdown(cancel_futures=True)
+
+
+async def serve(server, host, port, unix):
+    listener = await server.start(host, port, unix)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a spell checking server.")
+    parser.add_argument("--fst", help="spell FST saved with FST.save() (recommended)")
+    parser.add_argument("--lexicon", default="lexicon.txt")
+    parser.add_argument("--errors", default="spell-errors.json",
+                        help="edit counts from compute-weights.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("-n", "--nbest", type=int, default=5)
+    parser.add_argument("--batch-window", type=float, default=2.0,
+                        help="micro-batching window in milliseconds")
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-pending", type=int, default=1024)
+    args = parser.parse_args(argv)
+
+    if args.fst is not None:
+        server = SpellServer(filename=args.fst, processes=args.processes,
+                             n=args.nbest, batch_window=args.batch_window / 1000,
+                             max_batch=args.max_batch, max_pending=args.max_pending)
+    else:
+        with open(args.lexicon, 'rt') as f:
+            words = f.read().strip().split()
+        with open(args.errors, 'rt') as f:
+            errcount = json.loads(f.read())
+        server = SpellServer(spellcheck.build_spellfst(words, errcount),
+                             processes=args.processes, n=args.nbest,
+                             batch_window=args.batch_window / 1000,
+                             max_batch=args.max_batch, max_pending=args.max_pending)
+    try:
+        asyncio.run(serve(server, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,12 +7,21 @@ Honor Code:  I pledge that this program represents my work.
 We received help from: no one in designing and debugging our program.
 """
 
+import argparse
+import fileinput
+import functools
+import heapq
 import json
+import math
+import multiprocessing
+import re
+import sys
+from collections import OrderedDict
 
-from fsa import FSA, build_trie
-from fst import FST
-
-import numpy as np
+from buildcache import BuildCache
+from editmodel import EditModel
+from fsa import build_trie
+from fst import FST, FrozenFST, LazyComposeFST
 
 
 def build_editfst(alphabet, counts):
@@ -32,68 +41,692 @@ def build_editfst(alphabet, counts):
     Arguments:
     ----
     alphabet    All letters that we should recognize
-    counts      Counts generated by compute-weights.py
+    counts      Counts generated by compute-weights.py, or an EditModel
     """
-
-    def nested_dict_values(d):
-        for v in d.values():
-            if isinstance(v, dict):
-                yield from nested_dict_values(v)
-            else:
-                yield v
-
-    def weight(insym, outsym, count):
-        # calculate the log weight of corresponding amount
-        if insym not in count:
-            w = 1 / sum(nested_dict_values(count))
-            return np.log(w)
-        # smoothing for the weight
-        elif outsym not in count[insym]:
-            w = 1 / (sum(nested_dict_values(count[insym])) + len(count[insym].values()))
-            return np.log(w)
-        else:
-            w = count[insym][outsym] / sum(nested_dict_values(count[insym]))
-            return np.log(w)
-
+    model = counts if isinstance(counts, EditModel) else EditModel(counts)
     build = FST()
     for a in alphabet:
         # build transition with each alphabet
-        build.add_transition(0, a, 0, a, weight(a, a, counts))
-        build.add_transition(1, a, 1, a, weight(a, a, counts))
+        build.add_transition(0, a, 0, a, model.weight(a, a))
+        build.add_transition(1, a, 1, a, model.weight(a, a))
         # adding transition
-        build.add_transition(0, "", 1, a, weight("", a, counts))
+        build.add_transition(0, "", 1, a, model.weight("", a))
         # delete transition
-        build.add_transition(0, a, 1, "", weight(a, "", counts))
+        build.add_transition(0, a, 1, "", model.weight(a, ""))
         # add new transition when the new alphabet does not same as the old one
         for b in alphabet:
             if a != b:
-                build.add_transition(0, a, 1, b, weight(a, b, counts))
+                build.add_transition(0, a, 1, b, model.weight(a, b))
     # add accepting state
     build.mark_accepting(1)
     return build
 
 
-if __name__ == "__main__":
+class EditSearch:
+    """Find corrections with up to k edits without composing FSTs.
+
+    We walk the lexicon FSA and the misspelled word together, as a
+    Levenshtein automaton would, and the number of edits made so far
+    is part of the search state. Every step is one of the operations
+    of build_editfst(), with the same weights: copying a letter,
+    substituting, deleting or inserting one. The number of edits
+    is only bounded by k, so a word of the lexicon is its own
+    (zero-edit) correction. For k=2 on a large lexicon DeleteIndex
+    is much faster (see correct()).
+
+    Arguments:
+    ----
+    lexicon     A deterministic acyclic FSA, e.g. from build_trie()
+    alphabet    All letters that we should recognize
+    counts      Counts generated by compute-weights.py, or an EditModel
+    """
+
+    def __init__(self, lexicon, alphabet, counts):
+        self.lexicon = lexicon
+        self.arcs = dict()  # state -> [(sym, next state)]
+        for (s1, sym), s2s in lexicon.transitions.items():
+            for s2 in s2s:
+                self.arcs.setdefault(s1, []).append((sym, s2))
+        model = counts if isinstance(counts, EditModel) else EditModel(counts)
+        symbols = [""] + sorted(alphabet)
+        self.weights = {(a, b): model.weight(a, b)
+                        for a in symbols for b in symbols if a or b}
+        # state -> (shortest, longest) word suffix accepted from it
+        self.lengths = dict()
+        for state in self._postorder():
+            bounds = [(0, 0)] if lexicon.is_accepting(state) else []
+            bounds += [(short + 1, long + 1) for short, long in
+                       (self.lengths[s2] for _, s2 in self.arcs.get(state, ()))]
+            self.lengths[state] = (min(short for short, _ in bounds),
+                                   max(long for _, long in bounds)) if bounds else (1, -1)
+        # the cheapest way to consume each letter of the word (copying,
+        # substituting or inserting it), and how much more it costs at
+        # least if the letter is not copied, for the lower bounds of
+        # correct()
+        letters = symbols[1:]
+        self.min_delete = min((-self.weights[a, ""] for a in letters), default=0.0)
+        self.consume = dict()
+        self.not_copied = dict()  # letter -> least extra cost of not copying it
+        for c in letters:
+            substitute = min((-self.weights[a, c] for a in letters if a != c),
+                             default=math.inf)
+            insert = -self.weights["", c]
+            self.consume[c] = min(-self.weights[c, c], substitute, insert)
+            self.not_copied[c] = min(substitute - self.consume[c], insert - self.consume[c],
+                                     self.min_delete)
+        self.min_insert = min((-self.weights["", c] - self.consume[c] for c in letters),
+                              default=0.0)
+
+    def _postorder(self):
+        """Return the states reachable from the start state, each after
+        the states it has arcs to (the lexicon has no cycles).
+        """
+        order = []
+        visited = {self.lexicon.start_state}
+        stack = [(self.lexicon.start_state, iter(self.arcs.get(self.lexicon.start_state, ())))]
+        while stack:
+            state, arcs = stack[-1]
+            for _, s2 in arcs:
+                if s2 not in visited:
+                    visited.add(s2)
+                    stack.append((s2, iter(self.arcs.get(s2, ()))))
+                    break
+            else:
+                stack.pop()
+                order.append(state)
+        return order
+
+    def correct(self, word, k=2, n=10, max_cost=None):
+        """Return the n best corrections of word with at most k edits.
+
+        The result is a list of (correction, weight) pairs, best first,
+        like FST.transduce_nbest(). The search is A* on the cost
+        -weight, and paths that need more than k edits or cost more
+        than 'max_cost' are pruned.
+
+        The cost still to come from a state and position is at
+        least the cheapest way to consume each letter left, plus the
+        extra cost of the edits we already know are needed: deletions
+        or insertions if all suffixes of the lexicon from state are
+        longer or shorter than the rest of the word, or one edit if
+        state has no arc for the next letter. Paths are ordered by
+        cost so far plus this bound, and pruned if the sum exceeds
+        'max_cost'.
+
+        The lexicon shares states between words (build_trie() returns
+        a minimal FSA), so different prefixes of corrections meet in
+        the same (state, position in word). If n different prefixes
+        with no more edits already left a meeting point, a later
+        (costlier) prefix cannot lead to one of the n best
+        corrections: the n earlier ones followed by the same suffix
+        are better. So a (state, position) is expanded for at most n
+        prefixes with up to e edits, and never again for a prefix
+        already expanded with no more edits. States whose suffixes are
+        all too short or too long for the rest of the word and the
+        edits left are not entered at all.
+
+        The bound only prunes with a 'max_cost': otherwise the search
+        still visits every path within k edits whenever fewer than n
+        corrections exist. For k=2 that takes milliseconds (p50 about
+        3 ms on the 10k lexicon, 13 ms on 100k words), and even a
+        'max_cost' of 10 only halves it, so DeleteIndex is the engine
+        for k=2 (p50 about 0.3 ms); this one suits k=1 (about a
+        millisecond at most on 100k words).
+        """
+        weights = self.weights
+        lengths = self.lengths
+        transitions = self.lexicon.transitions
+        min_delete, min_insert = self.min_delete, self.min_insert
+        # the cheapest cost of consuming word[pos:], and the least
+        # extra cost if word[pos] is not copied
+        rest_cost = [0.0] * (len(word) + 1)
+        not_copied = [0.0] * (len(word) + 1)
+        for pos in range(len(word) - 1, -1, -1):
+            rest_cost[pos] = rest_cost[pos + 1] + self.consume.get(word[pos], math.inf)
+            not_copied[pos] = self.not_copied.get(word[pos], math.inf)
+
+        def bound(state, pos):
+            """ A lower bound of the cost from (state, pos) to a correction. """
+            short, long = lengths[state]
+            left = len(word) - pos
+            if left < short:
+                extra = (short - left) * min_delete
+            elif left > long:
+                extra = (left - long) * min_insert
+            else:
+                extra = 0.0
+            if left and (state, word[pos]) not in transitions and not_copied[pos] > extra:
+                extra = not_copied[pos]
+            return rest_cost[pos] + extra
+
+        results = []
+        found = set()
+        expanded = dict()  # (state, pos) -> {prefix: fewest edits}
+        full = dict()  # (state, pos) -> fewest edits with n prefixes expanded
+        counter = 0
+        start = self.lexicon.start_state
+        agenda = [(bound(start, 0), counter, 0.0, start, 0, 0, "")]
+        while agenda and len(results) < n:
+            estimate, _, cost, state, pos, edits, output = heapq.heappop(agenda)
+            if estimate == math.inf or (max_cost is not None and estimate > max_cost):
+                break
+            if full.get((state, pos), k + 1) <= edits:
+                continue
+            prefixes = expanded.setdefault((state, pos), {})
+            if prefixes.get(output, k + 1) <= edits:
+                continue
+            prefixes[output] = edits
+            if len(prefixes) >= n:
+                full[state, pos] = sorted(prefixes.values())[n - 1]
+            if (pos == len(word) and output not in found
+                    and self.lexicon.is_accepting(state)):
+                found.add(output)
+                results.append((output, -cost))
+            if edits == k:
+                # no edits left: the rest of the word must be in the
+                # lexicon as it is, which we can check in one walk
+                rest = word[pos:]
+                w = 0.0
+                for sym in rest:
+                    next_states = self.lexicon.move(sym, state)
+                    if next_states is None:
+                        break
+                    state = next(iter(next_states))
+                    w += weights[sym, sym]
+                else:
+                    if rest and (max_cost is None or cost - w <= max_cost):
+                        counter += 1
+                        heapq.heappush(agenda, (cost - w + bound(state, len(word)), counter,
+                                                cost - w, state, len(word), edits,
+                                                output + rest))
+                continue
+            steps = []
+            char = word[pos] if pos < len(word) else None
+            for sym, next_state in self.arcs.get(state, ()):
+                if sym == char:
+                    steps.append((next_state, pos + 1, edits, sym, weights[sym, sym]))
+                elif edits < k:
+                    if char is not None and (sym, char) in weights:
+                        steps.append((next_state, pos + 1, edits + 1, sym, weights[sym, char]))
+                    steps.append((next_state, pos, edits + 1, sym, weights[sym, ""]))
+            if char is not None and edits < k and ("", char) in weights:
+                steps.append((state, pos + 1, edits + 1, "", weights["", char]))
+            for next_state, next_pos, next_edits, sym, w in steps:
+                if full.get((next_state, next_pos), k + 1) <= next_edits:
+                    continue
+                # the rest of the word cannot become a suffix of the
+                # lexicon with the edits left
+                short, long = lengths[next_state]
+                if not short - (k - next_edits) <= len(word) - next_pos <= long + (k - next_edits):
+                    continue
+                next_cost = cost - w
+                next_estimate = next_cost + bound(next_state, next_pos)
+                if next_estimate == math.inf or (max_cost is not None
+                                                 and next_estimate > max_cost):
+                    continue
+                counter += 1
+                heapq.heappush(agenda, (next_estimate, counter, next_cost, next_state,
+                                        next_pos, next_edits, output + sym))
+        return results
+
+
+class DeleteIndex:
+    """Find corrections with up to 'max_edits' edits with a hash index.
+
+    This is the symmetric delete method of SymSpell: every string we
+    get by deleting at most max_edits letters of a word of the lexicon
+    is a key of the index, pointing to the words it came from. Two
+    words are within k edits only if they have a common delete of at
+    most k letters each, so the candidates of a query are found by
+    looking up its own deletes, a few dictionary lookups for short
+    words. The candidates are then scored by the best alignment with
+    at most k edits, with the weights of build_editfst(), so the
+    rankings are those of the FST engine.
+
+    Arguments:
+    ----
+    words       The words of the lexicon
+    counts      Counts generated by compute-weights.py, or an EditModel
+    max_edits   The largest k correct() can be called with
+    """
+
+    def __init__(self, words, counts, max_edits=2):
+        self.words = sorted(set(words))
+        self.max_edits = max_edits
+        self.index = dict()  # delete -> [word id]
+        for i, word in enumerate(self.words):
+            for key in self.deletes(word, max_edits):
+                self.index.setdefault(key, []).append(i)
+        model = counts if isinstance(counts, EditModel) else EditModel(counts)
+        symbols = [""] + sorted(set("".join(self.words)))
+        self.weights = {(a, b): model.weight(a, b)
+                        for a in symbols for b in symbols if a or b}
+
+    @staticmethod
+    def deletes(word, k):
+        """Return the set of strings made by deleting at most k letters of word.
+        """
+        result = {word}
+        level = {word}
+        for _ in range(k):
+            level = {s[:i] + s[i + 1:] for s in level for i in range(len(s))}
+            result |= level
+        return result
+
+    def candidates(self, word, k=1):
+        """Return the words of the lexicon that may be within k edits of word.
+        """
+        if k > self.max_edits:
+            raise ValueError("the index only supports up to {} edits".format(self.max_edits))
+        found = set()
+        for key in self.deletes(word, k):
+            found.update(self.index.get(key, ()))
+        return [self.words[i] for i in found]
+
+    def weight(self, correction, word, k=1):
+        """Return the weight of the best alignment of correction with
+        word using at most k edits, or None if there is none.
+        """
+        weights = self.weights
+        n, m = len(correction), len(word)
+        # best[i][j][e]: weight of correction[:i] -> word[:j] with e edits
+        best = [[[None] * (k + 1) for _ in range(m + 1)] for _ in range(n + 1)]
+        best[0][0][0] = 0.0
+
+        def update(i, j, e, w):
+            if best[i][j][e] is None or w > best[i][j][e]:
+                best[i][j][e] = w
+        for i in range(n + 1):
+            for j in range(m + 1):
+                for e, v in enumerate(best[i][j]):
+                    if v is None:
+                        continue
+                    a = correction[i] if i < n else None
+                    b = word[j] if j < m else None
+                    if a is not None and a == b:
+                        update(i + 1, j + 1, e, v + weights[a, a])
+                    if e == k:
+                        continue
+                    if a is not None and b is not None and a != b and (a, b) in weights:
+                        update(i + 1, j + 1, e + 1, v + weights[a, b])
+                    if a is not None:
+                        update(i + 1, j, e + 1, v + weights[a, ""])
+                    if b is not None and ("", b) in weights:
+                        update(i, j + 1, e + 1, v + weights["", b])
+        final = [w for w in best[n][m] if w is not None]
+        return max(final) if final else None
+
+    def correct(self, word, k=1, n=10, max_cost=None):
+        """Return the n best corrections of word with at most k edits.
+
+        The result is a list of (correction, weight) pairs, best first,
+        like FST.transduce_nbest(). For k=1 and a word that is not in
+        the lexicon, these are the results of transduce_nbest() on the
+        spell FST of build_spellfst().
+        """
+        results = []
+        for correction in self.candidates(word, k):
+            w = self.weight(correction, word, k)
+            if w is not None and (max_cost is None or -w <= max_cost):
+                results.append((correction, w))
+        results.sort(key=lambda result: (-result[1], result[0]))
+        return results[:n]
+
+
+class CorrectionCache:
+    """An LRU cache of corrections in front of a spell FST.
+
+    Results of spellfst.transduce_nbest() are kept for each
+    (word, n, max_cost) query. The least recently used entries are
+    evicted when there are more than 'max_entries' of them, or when
+    their estimated size goes over 'max_bytes' (None for no limit).
+    The cache is emptied when the FST is replaced (e.g., after the
+    edit weights were retrained) or modified.
+
+    Attributes:
+        hits, misses, evictions: counters since the creation (see stats())
+    """
+
+    def __init__(self, spellfst, max_entries=10000, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (result, size)
+        self._bytes = 0
+        self.spellfst = spellfst
+
+    @property
+    def spellfst(self):
+        return self._spellfst
+
+    @spellfst.setter
+    def spellfst(self, spellfst):
+        self._spellfst = spellfst
+        self._version = getattr(spellfst, "version", None)
+        self.clear()
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    @staticmethod
+    def _size(key, result):
+        """ Rough number of bytes used by an entry.
+        """
+        size = sys.getsizeof(key) + sys.getsizeof(key[0]) + sys.getsizeof(result)
+        for output, w in result:
+            size += sys.getsizeof(output) + 80  # the pair and the weight
+        return size
+
+    def correct(self, word, n=10, max_cost=None):
+        """Return spellfst.transduce_nbest(word, n, max_cost), cached.
+        """
+        version = getattr(self._spellfst, "version", None)
+        if version != self._version:
+            self._version = version
+            self.clear()
+        key = (word, n, max_cost)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return list(entry[0])
+        self.misses += 1
+        result = self._spellfst.transduce_nbest(word, n, max_cost)
+        size = self._size(key, result)
+        self._entries[key] = (tuple(result), size)
+        self._bytes += size
+        while self._entries and (
+                len(self._entries) > self.max_entries
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            _, (_, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+        return result
+
+    def stats(self):
+        """Return a dictionary of the cache counters and its size.
+        """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries), "bytes": self._bytes}
 
-    # Example usage
-    with open('lexicon.txt', 'rt') as f:
-        words = f.read().strip().split()
-    with open('spell-errors.json', 'rt') as f:
-        errcount = json.loads(f.read())
 
-    # Build the trie lexicon
-    fsa = build_trie(words)
-    # Minimize it
-    fsa.minimize()
+class SpellLexicon:
+    """A lexicon and its spell FST that can be changed word by word.
+
+    The lexicon is kept as a minimal FSA, and add() and remove() change
+    it with FSA.add_word() and FSA.remove_word(). Only the states of the
+    spell FST that pair with the lexicon states changed by the word are
+    updated: an FST made by compose_fst() is patched with
+    FST.recompose(), and for a LazyComposeFST (if 'lazy' is True) the
+    cached transitions of those states are dropped. A word with a
+    letter that is not in the edit FST yet needs a new edit FST, and
+    the whole spell FST is then built again (in place, the object
+    stays the same).
+
+    Attributes:
+        fsa: the minimal lexicon FSA, e.g. for recognize()
+        lexicon: the lexicon as an identity FST
+        edits: the edit FST of build_editfst(), inverted if 'lazy'
+            (it is then the first FST of the LazyComposeFST)
+        spellfst: the spell FST, mapping a word to its corrections
+    """
+
+    def __init__(self, words, counts, lazy=False):
+        self.counts = counts
+        self.lazy = lazy
+        self.fsa = build_trie(words)
+        self.lexicon = FST.fromfsa(self.fsa)
+        self.lexicon.accepting = set(self.fsa.accepting)
+        self.letters = set([char for word in words for char in word])
+        self.spellfst = None
+        self._build()
+
+    def _build(self):
+        self.edits = build_editfst(self.letters, self.counts)
+        if self.lazy:
+            self.edits.invert()
+            if self.spellfst is None:
+                self.spellfst = LazyComposeFST(self.edits, self.lexicon)
+            else:
+                self.spellfst.m1 = self.edits
+                self.spellfst.clear_cache()
+        else:
+            spellfst = FST.compose_fst(self.lexicon, self.edits).invert()
+            if self.spellfst is not None:
+                spellfst.version += self.spellfst.version + 1
+                self.spellfst.__dict__ = spellfst.__dict__
+            else:
+                self.spellfst = spellfst
+
+    def _update(self, word, changed):
+        """ Copy the changed states of the FSA to the lexicon FST, and
+        update the spell FST.
+        """
+        if not changed:
+            return False
+        lexicon = self.lexicon
+        for q in changed:
+            lexicon.remove_arcs(q)
+            if q in self.fsa._states:
+                lexicon._states.add(q)
+                for sym in self.fsa._alphabet:
+                    for q2 in self.fsa.transitions.get((q, sym), ()):
+                        lexicon.add_transition(q, sym, q2, sym)
+                if self.fsa.is_accepting(q):
+                    lexicon.mark_accepting(q)
+                else:
+                    lexicon.accepting.discard(q)
+            else:
+                lexicon._states.discard(q)
+                lexicon.accepting.discard(q)
+        if not set(word) <= self.letters:
+            self.letters.update(word)
+            self._build()
+        elif self.lazy:
+            self.spellfst.clear_cache(m2_states=changed)
+        else:
+            self.spellfst.recompose(lexicon, self.edits, changed, inverted=True)
+        return True
+
+    def add(self, word):
+        """Add word to the lexicon. Returns False if it was already in it.
+        """
+        return self._update(word, self.fsa.add_word(word))
+
+    def remove(self, word):
+        """Remove word from the lexicon. Returns False if it was not in it.
+        """
+        return self._update(word, self.fsa.remove_word(word))
+
+
+def _optimized_spellfst(lexicon, edits, report=None):
+    spellfst = FST.compose_fst(lexicon, edits).invert()
+    return spellfst.optimize(report=report).freeze()
+
+
+def lexicon_fsa(words, cache=None):
+    """Return an Artifact (see BuildCache) of the minimal FSA of words.
+
+    build_trie() builds the minimal FSA directly (see build_dawg()),
+    so there is no separate minimization stage. build_spellfst()
+    builds the FSA through this; pass the same Artifact there to use
+    the FSA for other things without building it twice.
+    """
+    if cache is None:
+        cache = BuildCache()
+    words = sorted(set(words))
+    # Build the trie lexicon, already minimal
+    return cache.stage("build_trie", build_trie, words)
+
+
+def build_spellfst(words, counts, optimize=False, report=None, cache=None, fsa=None):
+    """Build the spell checking FST from a word list and edit counts.
+
+    The result is the inverse of lexicon o edits as a FrozenFST: it
+    maps a (mis)spelled word to its corrections. The composition is
+    trimmed with connect(). If 'optimize' is True, it goes through
+    FST.optimize() (trimming, epsilon removal, determinization and
+    weight pushing) before it is frozen. The sizes before and after
+    each pass are appended to the list 'report' if it is given.
+
+    If 'cache' is a BuildCache, the output of every stage is looked up
+    in it first. When only the counts changed, only the edit FST and
+    the stages after it are built again, and when nothing changed the
+    spell FST is just memory-mapped (and there is nothing to report).
+    'fsa' is the lexicon_fsa() Artifact of words, if the caller has it.
+    """
+    if cache is None:
+        cache = BuildCache()
+    words = sorted(set(words))
+    if fsa is None:
+        fsa = lexicon_fsa(words, cache)
     # Convert it to an FST
-    lexicon = FST.fromfsa(fsa)
+    lexicon = cache.stage("fromfsa", FST.fromfsa, fsa)
     # Build the edit-distance FST
-    letters = set([char for word in words for char in word])
-    edits = build_editfst(letters, errcount)
-    edits.write("edit")
-    # Compose them
-    spellfst = FST.compose_fst(lexicon, edits)
+    letters = sorted(set([char for word in words for char in word]))
+    edits = cache.stage("build_editfst", build_editfst, letters, counts)
+    if optimize:
+        spellfst = cache.stage("optimize", lambda lexicon, edits:
+                               _optimized_spellfst(lexicon, edits, report),
+                               lexicon, edits, code=(_optimized_spellfst,))
+        return spellfst.value()
+    # Compose them into the compact array-backed form
+    spellfst = cache.stage("compose", FrozenFST.compose, lexicon, edits)
+    # Drop the states that cannot reach an accepting state
+    spellfst = cache.stage("connect", lambda fst: fst.connect(report), spellfst,
+                           code=(FrozenFST,))
     # The above generates all spelling mistakes, we want the invert
-    spellfst.invert()
-    for sperr, w in sorted(spellfst.transduce("wort"), key=lambda x: x[1], reverse=True):
-        print(sperr, w)
+    return cache.stage("invert", FrozenFST.invert, spellfst).value()
+
+
+_worker_fst = None  # the spell FST of a correct_batch() worker
+
+
+def _init_worker(filename):
+    global _worker_fst
+    if filename is not None:
+        _worker_fst = FrozenFST.load(filename, verify=False)
+
+
+def _correct_word(word, n, max_cost):
+    return _worker_fst.transduce_nbest(word, n, max_cost)
+
+
+def correct_batch(words, spellfst=None, filename=None, n=10, max_cost=None,
+                  processes=None, chunksize=64):
+    """Correct many words in parallel with a pool of processes.
+
+    Returns a list with the transduce_nbest() result of each word, in
+    the order of 'words'. The FST is never pickled: if 'filename' (a
+    file written by FST.save()) is given, each worker memory-maps it,
+    so all workers share the same pages. Otherwise 'spellfst' is
+    inherited by workers started with fork, and its arrays are shared
+    copy-on-write. 'processes' defaults to the number of CPUs.
+    """
+    global _worker_fst
+    if filename is not None:
+        context = multiprocessing.get_context()
+    elif spellfst is not None:
+        _worker_fst = spellfst
+        context = multiprocessing.get_context("fork")
+    else:
+        raise ValueError("either spellfst or filename is required")
+    correct = functools.partial(_correct_word, n=n, max_cost=max_cost)
+    with context.Pool(processes, initializer=_init_worker,
+                      initargs=(filename,)) as pool:
+        return pool.map(correct, words, chunksize)
+
+
+TOKEN_RE = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)*")
+
+
+def correct_stream(lines, lexicon, cache, n=5, max_cost=None):
+    """Find and correct the unknown words of a text, line by line.
+
+    For each line of 'lines' yields (line number, line, unknown) where
+    unknown is a list of (start, end, token, corrections) for the
+    tokens that the 'lexicon' FSA does not recognize (in lowercase).
+    Corrections are looked up through 'cache', a CorrectionCache, so a
+    token repeated within the last cache.max_entries unknown tokens is
+    only corrected once. Only one line is in memory at a time.
+    """
+    for lineno, line in enumerate(lines, 1):
+        unknown = []
+        for match in TOKEN_RE.finditer(line):
+            token = match.group().lower()
+            if lexicon.recognize(token):
+                continue
+            corrections = cache.correct(token, n, max_cost)
+            unknown.append((match.start(), match.end(), match.group(), corrections))
+        yield lineno, line, unknown
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Find and correct misspelled words in a text.")
+    parser.add_argument("files", nargs="*", default=["-"],
+                        help="input files (default: standard input)")
+    parser.add_argument("--format", choices=("jsonl", "text"), default="jsonl",
+                        help="one JSON object per unknown word, or the text "
+                             "with the best correction after each unknown word")
+    parser.add_argument("--lexicon", default="lexicon.txt")
+    parser.add_argument("--errors", default="spell-errors.json",
+                        help="edit counts from compute-weights.py")
+    parser.add_argument("--fst", help="use a spell FST saved with FST.save()")
+    parser.add_argument("--cache", help="directory to keep the outputs of the build "
+                                        "stages in, to reuse them on the next run")
+    parser.add_argument("-n", "--nbest", type=int, default=5)
+    parser.add_argument("--max-cost", type=float)
+    parser.add_argument("--optimize", action="store_true",
+                        help="remove epsilons, determinize and push the weights "
+                             "of the spell FST, reporting the sizes on stderr")
+    parser.add_argument("--window", type=int, default=10000,
+                        help="number of distinct unknown words to remember")
+    args = parser.parse_args(argv)
+
+    with open(args.lexicon, 'rt') as f:
+        words = f.read().strip().split()
+    build_cache = BuildCache(args.cache)
+    fsa = lexicon_fsa(words, build_cache)
+    if args.fst is not None:
+        spellfst = FST.load(args.fst)
+    else:
+        with open(args.errors, 'rt') as f:
+            errcount = json.loads(f.read())
+        report = []
+        spellfst = build_spellfst(words, errcount, args.optimize,
+                                  report if args.optimize else None,
+                                  build_cache, fsa)
+        for step in report:
+            print("{}: {} -> {} states, {} -> {} arcs".format(
+                step["pass"], step["before"]["states"], step["after"]["states"],
+                step["before"]["arcs"], step["after"]["arcs"]), file=sys.stderr)
+    lexicon = fsa.value()
+    cache = CorrectionCache(spellfst, max_entries=args.window)
+
+    with fileinput.input(args.files) as lines:
+        for lineno, line, unknown in correct_stream(lines, lexicon, cache,
+                                                    args.nbest, args.max_cost):
+            if args.format == "jsonl":
+                for start, end, token, corrections in unknown:
+                    print(json.dumps({"line": lineno, "start": start, "end": end,
+                                      "token": token, "corrections": corrections},
+                                     ensure_ascii=False))
+            else:
+                pieces, pos = [], 0
+                for start, end, token, corrections in unknown:
+                    best = corrections[0][0] if corrections else "?"
+                    pieces.append(line[pos:end] + "[" + best + "]")
+                    pos = end
+                pieces.append(line[pos:])
+                sys.stdout.write("".join(pieces))
+
+
+if __name__ == "__main__":
+    main()